@@ -5,14 +5,27 @@
 import sys, re
 import numpy as np
 import matplotlib.pyplot as plt
-import scipy.io.wavfile as wave
 from scipy.signal import medfilt
+from module_audio import wavread	# Memory-mapped WAV input
+
+#================================================
+# Moving median envelope smoothing at a reduced rate
+# The envelope is block averaged (step samples per block) before the
+# median filter runs, so the median window shrinks by the same factor.
+
+def mediansmooth(env, medwin, step):
+	blockcount = len(env) // step
+	lowenv = env[:blockcount*step].reshape(blockcount, step).mean(axis=1)
+	lowmedwin = max(1, medwin // step) | 1	# Only odd values!
+	return medfilt(lowenv, lowmedwin)
+
+#================================================
 
 # Input WAV file
 wavfilename = sys.argv[1]
 pngfilestem = re.sub(".wav","",wavfilename)
 appfilestem = re.sub(".py","",sys.argv[0])
-samplerate, signal = wave.read(wavfilename)
+samplerate, signal = wavread(wavfilename)
 period = 1/samplerate
 siglen = len(signal)
 sigsecs = siglen / samplerate
@@ -23,9 +36,10 @@ mags = np.abs(np.fft.rfft(env))
 freqs = np.fft.rfftfreq(env.size, period)
 
 # Select LF spectrum
-signal = signal / max(signal)
-env = medfilt(env / max(env), 301)
-mags = mags / max(mags)
+signal = signal / np.max(signal)
+envstep = 20	# block length for median smoothing
+env = mediansmooth(env / np.max(env), 301, envstep)
+mags = mags / np.max(mags)
 
 # Generate graphics
 maxfreq = 6
@@ -37,7 +51,8 @@ x = np.linspace(0, sigsecs, siglen)
 plt.subplot(3,1,1)	# waveform
 plt.plot(x, signal)
 plt.subplot(3,1,2)	# env
-plt.plot(x, env)
+xenv = np.arange(len(env)) * envstep / samplerate
+plt.plot(xenv, env)
 plt.subplot(3,1,3)	# env
 plt.plot(freqs, mags)
 
@@ -7,14 +7,27 @@ figheight = 6
 maxfreq = 6
 peaks = True
 peaklevel = 0.9
+envmedwin = 301	# envelope median window (full rate samples)
+envstep = 20	# envelope block length for median smoothing
 
 #================================================
 
 import sys, re
 import numpy as np
 import matplotlib.pyplot as plt
-import scipy.io.wavfile as wave
 from scipy.signal import medfilt
+from module_audio import wavread	# Memory-mapped WAV input
+
+#================================================
+# Moving median envelope smoothing at a reduced rate
+# The envelope is block averaged (step samples per block) before the
+# median filter runs, so the median window shrinks by the same factor.
+
+def mediansmooth(env, medwin, step):
+	blockcount = len(env) // step
+	lowenv = env[:blockcount*step].reshape(blockcount, step).mean(axis=1)
+	lowmedwin = max(1, medwin // step) | 1	# Only odd values!
+	return medfilt(lowenv, lowmedwin)
 
 #================================================
 # Input command line arguments
@@ -25,7 +38,7 @@ appfilestem = re.sub(".py","",sys.argv[0])
 
 # Input audio signal
 
-fs, signal = wave.read(wavfilename)
+fs, signal = wavread(wavfilename)
 period = 1/fs
 siglen = len(signal)
 sigsecs = siglen / fs
@@ -40,16 +53,16 @@ freqs = np.fft.rfftfreq(env.size, period)
 #================================================
 # Normalise signal and envelope
 
-signal = signal / max(signal)
-env = medfilt(env / max(env), 301) # Only odd values!
-env = env/max(env)
+signal = signal / np.max(signal)
+env = mediansmooth(env / np.max(env), envmedwin, envstep)
+env = env/np.max(env)
 
 # Select LF spectrum
 xoffset = 4		# Arbitrary offset to exclude 0
 foffset = xoffset / fs
 maxsample = int(round(maxfreq*sigsecs))
 mags = mags[xoffset:maxsample]
-mags = mags / max(mags)
+mags = mags / np.max(mags)
 freqs = freqs[xoffset:maxsample]
 
 #================================================
@@ -57,16 +70,17 @@ freqs = freqs[xoffset:maxsample]
 
 fig = plt.figure(figsize=(figwidth, figheight))
 x = np.linspace(0, sigsecs, siglen)
+xenv = np.arange(len(env)) * envstep / fs
 
 plt.suptitle("Duration: %.3f, Sample rate: %d, file: %s"%(sigsecs, fs, wavfilename))
 
 plt.subplot(3,1,1)	# waveform
 plt.plot(x, signal, color="b")
-plt.plot(x, env, color="orange")
+plt.plot(xenv, env, color="orange")
 plt.xlim(0,sigsecs)
 
 plt.subplot(3,1,2)	# env
-plt.plot(x, env, color="orange")
+plt.plot(xenv, env, color="orange")
 plt.xlim(0,sigsecs)
 plt.title("Envelope")
 
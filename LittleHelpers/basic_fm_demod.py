@@ -24,6 +24,9 @@
 import sys, re
 import numpy as np
 from scipy.signal import medfilt, hilbert
+from scipy.ndimage import maximum_filter1d
+from numpy.lib.stride_tricks import sliding_window_view
+from module_audio import wavread, normalise	# Memory-mapped WAV input
 import scipy.io.wavfile as wav
 import matplotlib.pyplot as plt
 
@@ -137,6 +140,9 @@ try:
 # F0 post-processing with moving median window
 	f0medwin = 5	# Must be an odd integer. Default 5
 
+# Batched AMDF: upper limit of frames x lags x samples per numpy operation
+	amdfbatchsize = 2**22
+
 except:
 	print('Parameter error.'); exit()
 
@@ -145,11 +151,10 @@ except:
 # WAV file input
 
 try:
-	fs, signal = wav.read(filename)
+	fs, signal = wavread(filename)
 
 	signallen = len(signal)
 	signalduration = int(round(1.0*signallen/fs))
-	abssignal = abs(signal)
 
 except:
 	print("Error reading signal."); exit()
@@ -159,14 +164,16 @@ except:
 # Preprocessing (centre-clipping)
 
 try:
-	signal = signal / float(np.max(abs(signal)))  # Normalisation
+	signal = normalise(signal)  # Normalisation
 
-	signal = np.array([	s if abs(s)>centreclip else 0 for s in signal ])
-	signal = np.array([	s if abs(s)<peakclip else 1 for s in signal ])
+	signal = np.where(abs(signal) > centreclip, signal, 0)
+	signal = np.where(abs(signal) < peakclip, signal, 1)
 
 	abssignal = abs(signal)
 
-	envelope = [ max(abssignal[i-peakwin:i]) for i in range(peakwin,len(abssignal)) ]
+	# Peak envelope: maximum of the peakwin samples from each position on
+	envelope = maximum_filter1d(abssignal, peakwin, origin=-(peakwin//2))
+	envelope = envelope[:len(abssignal)-peakwin]
 	envelope = np.append(medfilt(envelope,envmed),[0]*peakwin)
 	envelope = envelope / max(envelope)
 	
@@ -196,32 +203,38 @@ if True:
 #	newsignallen = framecount * framelen
 #	signal = signal[:newsignallen]
 
-# Allocate memory for f0list and AMDF list
+# Allocate memory for f0list
 	f0list = np.zeros(framecount)
-	meandiffs = np.zeros(framelen).tolist()
 
-# Move frame window through signal
-	for count, framestart in enumerate(irange):
-		framestop = framestart + framelen
-		frame = signal[framestart:framestop]
+# All framelen-long windows of the signal, as a view (no copy)
+	windows = sliding_window_view(signal, framelen)
+	lags = np.arange(framelen)
+	framestarts = np.array(irange)
+	batchframes = max(1, amdfbatchsize // (framelen * framelen))
+
+# Move frame window through signal, a batch of frames at a time
+	for batchstart in range(0, len(framestarts), batchframes):
+		starts = framestarts[batchstart:batchstart+batchframes]
+		frames = windows[starts]
 
-# Calculate Average Magnitude Difference Function with moving window
-		for lag, winstart in enumerate(range(framestart,framestop)):
-			movingwin = signal[winstart:winstart+framelen]
-			meandiffs[lag] = np.mean(abs(frame - movingwin))
+# Calculate Average Magnitude Difference Function for all lags at once
+		movingwins = windows[starts[:,np.newaxis] + lags]
+		meandiffs = np.mean(abs(frames[:,np.newaxis,:] - movingwins), axis=2)
 
-# Pick smallest absolute difference in frame
-		smallestdiff = np.min(meandiffs[frameoffsetposition:])
+# Pick smallest absolute difference in each frame
+		smallestdiffs = np.min(meandiffs[:,frameoffsetposition:], axis=1)
 
-# Get position of the smallest absolute difference
-		smallestdiffposition = meandiffs.index(smallestdiff)
+# Get first position of the smallest absolute difference
+		smallestdiffpositions = np.argmax(meandiffs == smallestdiffs[:,np.newaxis], axis=1)
 
 # Divide the sampling rate by the number of samples in the interval
 # That is: t = index/fs; f0 = 1/t
-		f0 = fs / smallestdiffposition if smallestdiffposition > 0 else 0
+		f0s = np.zeros(len(starts))
+		nonzero = smallestdiffpositions > 0
+		f0s[nonzero] = fs / smallestdiffpositions[nonzero]
 
 # Extend f0 list
-		f0list[count] = f0
+		f0list[batchstart:batchstart+len(starts)] = f0s
 
 if False:
 	print("F0 estimation error."); exit()
@@ -278,7 +291,7 @@ except:
 
 try:
 	signal = medfilt(signal,31)
-	signal = signal / max(abs(signal))
+	signal = signal / np.max(abs(signal))
 	peakwin = 20
 	x = np.linspace(0,signalduration,len(envelope))
 	sp2.plot(x,envelope,color='r',linewidth=1)
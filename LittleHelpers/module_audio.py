@@ -0,0 +1,130 @@
+# module_audio.py
+# D. Gibbon
+# Created 2022-07-20
+# WAV input module for the LittleHelpers scripts
+
+"""
+WAV file input
+
+- The WAV data are memory-mapped, not read into memory:
+  only the samples which are actually used are paged in.
+- Optional time range (seconds) selects a region without copying.
+- Multichannel data can be reduced to one channel, or turned into
+  a (channels, samples) view for batched processing of all channels.
+- Normalisation to -1 ... 1 finds the peak without temporary arrays
+  and scales in a single vectorised pass, which makes the float copy.
+- 24-bit WAV files cannot be memory-mapped by scipy; they are read.
+- Items of a packed corpus (see rfa_pack.py) are addressed as
+  <corpus>.pack/<name>, like files in a directory, and are read as
+  memory-mapped views of the corpus, without opening separate files.
+"""
+
+#===============================================================
+
+import re
+import numpy as np
+import scipy.io.wavfile as wave
+
+#===============================================================
+# Packed corpus input
+# A packed corpus is a blob of raw sample data, <corpus>.pack, and an
+# index, <corpus>.pack.npy, with name, byte offset, length in samples,
+# sampling rate, channel count and sample type of each item.
+# Each corpus is opened (index loaded, blob memory-mapped) only once.
+
+packs = {}
+
+def packopen(packfilename):
+
+	if packfilename not in packs:
+		index = np.load(packfilename + ".npy")
+		blob = np.memmap(packfilename, dtype=np.uint8, mode="r")
+		rows = { name: k for k, name in enumerate(index["name"].tolist()) }
+		packs[packfilename] = (index, blob, rows)
+
+	return packs[packfilename]
+
+def packnames(packfilename):
+
+	index, blob, rows = packopen(packfilename)
+
+	return index["name"].tolist()
+
+def packsplit(wavfilename):
+
+	match = re.match(r"(.*\.pack)/([^/]+)$", wavfilename)
+	if match is None: return None
+
+	return match.group(1), match.group(2)
+
+def packitem(packfilename, name):
+
+	index, blob, rows = packopen(packfilename)
+	item = index[rows[name]]
+	dtype = np.dtype(str(item["dtype"]))
+	channels = int(item["channels"])
+	start = int(item["offset"])
+	stop = start + int(item["length"]) * channels * dtype.itemsize
+	signal = blob[start:stop].view(dtype)
+	if channels > 1: signal = signal.reshape(-1, channels)	# as in WAV files
+
+	return int(item["fs"]), signal
+
+#===============================================================
+# Memory-mapped input with optional time range and channel
+
+def wavread(wavfilename, starttime=None, stoptime=None, channel=None):
+
+	packed = packsplit(wavfilename)
+	if packed is not None:
+		fs, signal = packitem(*packed)
+	else:
+		try:
+			fs, signal = wave.read(wavfilename, mmap=True)
+		except ValueError:
+			fs, signal = wave.read(wavfilename)
+
+	start = None if starttime is None else int(round(starttime * fs))
+	stop = None if stoptime is None else int(round(stoptime * fs))
+	signal = signal[start:stop]
+
+	# Multichannel WAV data are (samples, channels)
+	if channel is not None and signal.ndim > 1:
+		signal = signal[:, channel]
+
+	return fs, signal
+
+#===============================================================
+# Channels first: (channels, samples), also for mono, as a view
+
+def channelsfirst(signal):
+
+	if signal.ndim == 1:
+		return signal[np.newaxis, :]
+
+	return signal.T
+
+#===============================================================
+# Normalisation: -1 ... 0 ... 1
+# With axis=-1, each channel of a (channels, samples) array separately
+
+def signalpeak(signal, axis=None):
+
+	# float64 avoids integer overflow of -min for the most negative value
+	maxima = np.asarray(np.max(signal, axis=axis, keepdims=True), dtype=np.float64)
+	minima = np.asarray(np.min(signal, axis=axis, keepdims=True), dtype=np.float64)
+	peak = np.maximum(maxima, -minima)
+	peak[peak == 0.0] = 1.0	# silence
+
+	if axis is None: return float(peak.ravel()[0])
+
+	return peak
+
+def normalise(signal, dtype=np.float64, peak=None, axis=None):
+
+	if peak is None: peak = signalpeak(signal, axis)
+
+	return np.divide(signal, peak, dtype=dtype)
+
+#===============================================================
+# EOF
@@ -40,7 +40,10 @@ Four algorithm styles are provided, user selectable: A, B, C, D.
 
 #===============================================================
 
+import os
 import numpy as np
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 from scipy.signal import butter, lfilter, medfilt, tukey
 
 #===============================================================
@@ -232,5 +235,137 @@ AMDF:
 
 	return f0track, framerate, f0frameduration
 
+#===============================================================
+#===============================================================
+# F0 estimation for all channels of a (channels, samples) array
+# The channels are processed concurrently, one worker per channel up
+# to workers (0: one per channel), and at most one per CPU: in the
+# shared channel pool if it was started (forked processes), else in
+# threads.
+# The channel pool is started before threads are (e.g. those of the
+# read/write pipeline): forking a process with running threads can
+# deadlock on locks which they hold. It is only started for files with
+# several channels, with at most one worker per channel.
+
+channelpool = None
+
+def f0poolstart(workers=0, channels=None):
+
+	"""Starts the channel pool: at most workers, channels (largest channel count) and CPUs."""
+
+	global channelpool
+
+	workers = min(workers if workers > 0 else os.cpu_count() or 1, os.cpu_count() or 1)
+	if channels is not None: workers = min(workers, channels)
+	if channelpool is None and workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+		channelpool = multiprocessing.get_context("fork").Pool(workers)	# all workers forked now
+
+	return
+
+def f0poolstop():
+
+	global channelpool
+
+	if channelpool is not None:
+		channelpool.close()
+		channelpool.join()
+		channelpool = None
+
+	return
+
+def f0estimatechannels(signals, fs, workers=0):
+
+	channelcount = len(signals)
+	workers = min(channelcount if workers == 0 else workers, channelcount, os.cpu_count() or 1)
+
+	if workers <= 1:
+		results = [ f0estimate(signal, fs) for signal in signals ]
+	elif channelpool is not None:
+		results = channelpool.starmap(f0estimate, [ (signal, fs) for signal in signals ])
+	else:
+		with ThreadPoolExecutor(workers) as pool:
+			results = list(pool.map(f0estimate, signals, [fs]*channelcount))
+
+	f0tracks = np.array([ f0track for f0track, framerate, frameduration in results ])
+
+	return f0tracks, framerate, f0frameduration
+
+#===============================================================
+#===============================================================
+# Block-wise (streamed) F0 estimation with carried filter state
+# Blocks of the normalised signal are passed in order.
+# The Butterworth filter states are carried from block to block,
+# and filtered samples still needed by later frames are kept.
+# The result is identical to f0estimate() on the complete signal.
+
+def f0streamstart(signallength, fs):
+
+	framelength = int(f0frameduration * fs)
+
+	filters = []
+	for cutoff, order, type in (
+		(fmbutterlow, fmbutterloworder, "low"),
+		(fmbutterhigh, fmbutterhighorder, "high") ):
+		b, a = butter(order, cutoff / (0.5 * fs), btype=type, analog=False)
+		filters += [ (b, a, np.zeros(max(len(a), len(b)) - 1)) ]
+
+	state = {
+		"fs": fs, "framelength": framelength,
+		"frameskip": int(framelength * f0frameskipfactor),
+		"f0diffoffsetlength": int(f0diffoffsetduration * fs),
+		"framestarts": range(0, signallength-3*framelength, int(framelength * f0frameskipfactor)),
+		"nextframe": 0, "filters": filters,
+		"buffer": np.zeros(0), "bufferstart": 0, "f0track": [] }
+
+	return state
+
+def f0streamblock(state, block):
+
+	fs = state["fs"]
+	framelength = state["framelength"]
+	framestarts = state["framestarts"]
+
+	# F0 preprocessing: clip the low amplitude noise between speech units
+	block = clipper(block,centrethresh,"centre")
+	block = clipper(block,limitthresh,"limit")
+	for k, (b, a, zi) in enumerate(state["filters"]):
+		block, zi = lfilter(b, a, block, zi=zi)
+		state["filters"][k] = (b, a, zi)
+
+	state["buffer"] = np.append(state["buffer"], block)
+	bufferstart = state["bufferstart"]
+	bufferstop = bufferstart + len(state["buffer"])
+
+	# A frame and its lag windows span 2 * framelength - 1 samples
+	while state["nextframe"] < len(framestarts):
+		framestart = framestarts[state["nextframe"]]
+		if framestart + 2*framelength - 1 > bufferstop: break
+		state["f0track"] += [ f0amdf(
+			state["buffer"], fs, framestart - bufferstart, framelength,
+			state["f0diffoffsetlength"], "B") ]
+		state["nextframe"] += 1
+
+	# Keep only the samples still needed by later frames
+	if state["nextframe"] < len(framestarts):
+		keepfrom = min(framestarts[state["nextframe"]], bufferstop)
+	else:
+		keepfrom = bufferstop
+	state["buffer"] = state["buffer"][keepfrom-bufferstart:]
+	state["bufferstart"] = keepfrom
+
+	return
+
+def f0streamend(state):
+
+	f0track = np.array(state["f0track"])
+
+	#===============================================================
+	# F0 median smoothing and min max cutoff
+
+	f0track = medfilt(f0track, f0medfilter)
+	f0track = [ 0 if (f0 < f0min) or (f0 > f0max) else f0 for f0 in f0track ]
+
+	return f0track, framerate, f0frameduration
+
 #----------------------------------------------------------------------
 
@@ -0,0 +1,257 @@
+# module_analysis.py
+# D. Gibbon
+# Created 2022-07-20
+# Per-file analysis module for rfa_mult.py
+
+"""
+Analysis of one WAV file, as one function
+
+All channels of the file are analysed, and the property vectors are
+returned as a feature collection (see module_features.py) with one row
+per channel. The function has no side effects, so that files can be
+analysed independently: skipped when cached, isolated when they fail.
+Parameters are taken from rfa_mult_conf.py.
+"""
+
+#===============================================================
+
+import re
+import numpy as np
+from scipy.signal import butter, lfilter
+
+from module_F0 import *	# FM demodulation (F0 estimation, 'pitch' tracking)
+from module_spectrogram import *	# Low frequency spectrogram functions
+from module_envelope import *	# Multi-rate AM envelope extraction
+from module_peaks import *	# Spectral peak extraction
+from module_audio import *	# Memory-mapped WAV input
+from module_features import *	# Feature collection
+from module_parallel import threadlimit	# Worker process thread limits
+
+from rfa_mult_conf import *
+
+#===============================================================
+# Features: one row per file (or channel) for each feature
+# The feature names are also the names of the exported CSV files
+
+featurenames = [
+	"lfamspecmags", "lfammaxmags", "lfammaxfreqs", "lfambandspecmags",
+	"lfamtrajmags", "lfamtrajfreqs",
+	"lffmspecmags", "lffmmaxmags", "lffmmaxfreqs",
+	"lffmtrajmags", "lffmtrajfreqs" ]
+
+#===============================================================
+# Configuration values which determine the analysis results
+
+analysisparameters = [
+	"multirateenvelope", "envelopefsmin", "envelopecutoff", "envelopeorder",
+	"ambandanalysis", "ambands", "ambandtaps",
+	"amspecfreqmin", "amspecfreqmax", "fmspecfreqmin", "fmspecfreqmax",
+	"amformantlimit", "fmformantlimit", "magscount", "spectrumpower",
+	"specdownsample", "specwindowsecs", "specstrides",
+	"fixedgrid", "gridfreqpoints", "gridtimepoints" ]
+
+def analysisconfig():
+
+	return { name: globals()[name] for name in analysisparameters }
+
+#===============================================================
+# Linear interpolation along the last axis onto a grid, all rows at once
+
+def gridsample(grid, x, values):
+
+	values = np.asarray(values)
+	if len(x) == 1: return np.repeat(values, len(grid), axis=-1)
+	position = np.interp(grid, x, np.arange(len(x)))
+	lower = np.minimum(np.floor(position).astype(int), len(x)-2)
+	weight = position - lower
+
+	return values[..., lower] * (1-weight) + values[..., lower+1] * weight
+
+#===============================================================
+# Analysis of one file
+
+# WAV file input: all channels as one (channels, samples) array,
+# also for mono; separate from the analysis, so that it can be
+# done ahead of time (see module_pipeline.py)
+
+def rfaread(wavfilename):
+
+	fs, signal = wavread(wavfilename)	# memory-map sampling frequency and signal
+	signal = channelsfirst(signal)	# (channels, samples) view
+	signal = normalise(signal, axis=-1)	# scale each channel: -1 ... 0 ... 1
+
+	return fs, signal
+
+def rfaanalysis(wavfilename, audio=None):
+
+	wavfilebase = re.sub(".*/", "", wavfilename)
+	features = featurecollection(featurenames)
+
+	#=======================================================
+	# WAV file input (unless already read) and signal time domain properties
+
+	if audio is None: audio = rfaread(wavfilename)
+	fs, signal = audio
+	channelcount, signallength = signal.shape	# define numerical signal length
+	signalseconds = signallength / fs	# define signal length in seconds
+
+	#===============================================================
+	#===============================================================
+	# AM demodulation (envelope extraction) by full-wave rectification
+	# Butterworth LP filter (5 Hz: typical upper limit for LF spectrum)
+
+	if multirateenvelope:
+		# Rectify, decimate in stages, filter at the low envelope rate
+		envelope, envfs = amenvelope(
+			signal, fs, envelopefsmin, envelopecutoff, envelopeorder)
+	else:
+		b, a = butter(5, 5 / (0.5 * fs), btype="low")	# define Butterworth filter
+		envelope = lfilter(b, a, abs(signal), axis=-1)	# apply filter to create lf envelope
+		envfs = fs
+	envmin = np.min(envelope, axis=-1, keepdims=True)
+	envmax = np.max(envelope, axis=-1, keepdims=True)
+	envelope = envelope-envmin / (envmax-envmin)	# scale
+
+	#===============================================================
+	# AM low frequency spectral analysis (all channels in one FFT)
+
+	# FFT of complete envelope, output magnitude values
+	amspecmags = np.abs(np.fft.rfft(envelope, axis=-1))
+	amspecmaglen = amspecmags.shape[-1]
+
+	# Extraction of low frequency spectrum segment
+	lfamspecmaglen = int(round(amspecfreqmax * amspecmaglen / (envfs / 2)))
+	lfamspecmags = amspecmags[:, 1:lfamspecmaglen]	# DC cutoff
+	lfamspmMin = np.min(lfamspecmags, axis=-1, keepdims=True)
+	lfamspmMax = np.max(lfamspecmags, axis=-1, keepdims=True)
+	# Scale to 0...1
+	lfamspecmags = (lfamspecmags-lfamspmMin) / (lfamspmMax-lfamspmMin)
+
+	# Assign LF spectrum frequencies to magnitude values
+	lfamspecfreqs = np.linspace(0,envfs/2,amspecmaglen)
+	lfamspecfreqs = lfamspecfreqs[1:lfamspecmaglen]
+
+	# Identification of highest magnitude spectral frequencies
+	amtopmagscount = magscount
+	amtopmags, amtopfreqs, amtoppos = spectralpeaks(
+		lfamspecmags, lfamspecfreqs, amtopmagscount)
+
+	#===============================================================
+	# Optional band-wise AM LF spectra (channels x bands x frequencies)
+
+	if ambandanalysis:
+		lfambandmags, lfambandfreqs = ambandspectra(
+			signal, fs, ambands, ambandtaps,
+			envelopefsmin, envelopecutoff, envelopeorder, amspecfreqmax)
+
+	#===============================================================
+	# Create AM spectrogram and max magnitude value trajectory
+
+	ammagarray, amfreqarray, amtrajmags, amtrajfreqs = spectrogramarray(
+		signal, fs,amspecfreqmin, amspecfreqmax,
+		specdownsample, spectrumpower, specwindowsecs, specstrides
+		)
+
+	#===============================================================
+	#===============================================================
+	# FM demodulation (F0 estimation, pitch extraction)
+	# by AMDF (Absolute Magnitude Difference Function)
+	# Channels are processed concurrently
+
+	f0array, framerate, frameduration = f0estimatechannels(signal, fs, channelworkers)
+	f0arraylength = f0array.shape[-1]
+
+	#===============================================================
+	# FFT low frequency spectral analysis of F0 estimation track
+
+	fmspecmags = np.abs(np.fft.rfft(f0array, axis=-1))
+	fmspecmaglen = fmspecmags.shape[-1]
+	fmspecfreqs = np.linspace(0,framerate/2,fmspecmaglen)
+
+	# Extraction of low frequency spectral segment, with magnitude filter
+	lffmspecmaglen = int(round(fmspecfreqmax * fmspecmaglen / (framerate / 2)))
+	lffmspecmags = fmspecmags[:, 1:lffmspecmaglen]
+	lffmspecmags = lffmspecmags / np.max(lffmspecmags, axis=-1, keepdims=True)
+
+	# Magnitude filter for LF formant analysis
+	lffmformantmags = np.where(lffmspecmags <= fmformantlimit, 0, lffmspecmags)
+	lffmspecfreqs = fmspecfreqs[1:lffmspecmaglen]	# DC cutoff
+
+	# Identification of highest magnitude spectral frequencies
+	fmtopmagscount = magscount
+	fmtopmags, fmtopfreqs, fmtoppos = spectralpeaks(
+		lffmspecmags, lffmspecfreqs, fmtopmagscount)
+
+	#===============================================================
+	# Create FM spectrogram and max value trajectory
+
+	fmmagarray, fmfreqarray, fmtrajmags, fmtrajfreqs = spectrogramarray(
+		f0array, framerate, fmspecfreqmin, fmspecfreqmax,
+		specdownsample, spectrumpower, specwindowsecs, specstrides
+		)
+
+	#===============================================================
+	# Optional fixed grids: LF spectra on a common frequency grid,
+	# trajectories on a common (relative) time grid, so that the
+	# vectors of all files have the same length and refer to the same
+	# frequencies; spectral peaks are taken before, from the full spectra
+
+	if fixedgrid:
+		amfreqgrid = np.linspace(0, amspecfreqmax, gridfreqpoints+1)[1:]	# DC excluded
+		fmfreqgrid = np.linspace(0, fmspecfreqmax, gridfreqpoints+1)[1:]
+		lfamspecmags = gridsample(amfreqgrid, lfamspecfreqs, lfamspecmags)
+		lffmspecmags = gridsample(fmfreqgrid, lffmspecfreqs, lffmspecmags)
+		if ambandanalysis:
+			lfambandmags = gridsample(amfreqgrid, lfambandfreqs, lfambandmags)
+
+		timegrid = np.linspace(0, 1, gridtimepoints)
+		amtrajtimes = np.linspace(0, 1, amtrajmags.shape[-1])
+		fmtrajtimes = np.linspace(0, 1, fmtrajmags.shape[-1])
+		amtrajmags = gridsample(timegrid, amtrajtimes, amtrajmags)
+		amtrajfreqs = gridsample(timegrid, amtrajtimes, amtrajfreqs)
+		fmtrajmags = gridsample(timegrid, fmtrajtimes, fmtrajmags)
+		fmtrajfreqs = gridsample(timegrid, fmtrajtimes, fmtrajfreqs)
+
+	#===============================================================
+	# Feature rows, one row per channel
+	# Rows are keyed by file name, and by channel if there are several
+
+	for c in range(channelcount):
+		rowname = wavfilebase if channelcount == 1 else "%s:ch%d"%(wavfilebase, c+1)
+		# AM spectrum features
+		featureappend(features, "lfamspecmags", rowname, lfamspecmags[c])
+		featureappend(features, "lfammaxmags", rowname, amtopmags[c])
+		featureappend(features, "lfammaxfreqs", rowname, amtopfreqs[c])
+		# AM band spectra, one row per band
+		if ambandanalysis:
+			for (low, high), bandmags in zip(nyqvistbands(fs, ambands), lfambandmags[c]):
+				bandname = "%s_%d-%dHz"%(rowname, low, high)
+				featureappend(features, "lfambandspecmags", bandname, bandmags)
+		# AM spectrogram max trajectory features
+		featureappend(features, "lfamtrajmags", rowname, amtrajmags[c])
+		featureappend(features, "lfamtrajfreqs", rowname, amtrajfreqs[c])
+		# FM spectrum features
+		featureappend(features, "lffmspecmags", rowname, lffmspecmags[c])
+		featureappend(features, "lffmmaxmags", rowname, fmtopmags[c])
+		featureappend(features, "lffmmaxfreqs", rowname, fmtopfreqs[c])
+		# FM spectrogram max trajectory features
+		featureappend(features, "lffmtrajmags", rowname, fmtrajmags[c])
+		featureappend(features, "lffmtrajfreqs", rowname, fmtrajfreqs[c])
+
+	return features
+
+#===============================================================
+# Worker process initialisation (see module_parallel.py):
+# limited BLAS/FFT threads, and no nested F0 channel workers
+
+def rfaworkerinit(threads):
+
+	global channelworkers
+
+	threadlimit(threads)
+	channelworkers = 1
+
+	return
+
+#===============================================================
+# EOF
@@ -0,0 +1,284 @@
+# module_dendro.py
+# D. Gibbon
+# Created 2022-07-20
+# Parallel dendrogram and network rendering module for numdistnetdendro.py
+
+"""
+Dendrograms and distance networks of property vector tables, rendered
+in parallel
+
+- The distances of each table are computed once per metric (pdist)
+  and kept in dendrotables, which forked worker processes inherit
+  without copying; tasks only name a table, a metric and a method.
+- Each task renders one figure: a dendrogram (metric x method) or a
+  distance network (metric). The tasks of all tables go to one process
+  pool (see module_parallel.py); figures are drawn with the headless
+  Agg backend.
+- Tables of distanceblockedrows rows or more get float32 condensed
+  distances, computed in parallel blocks into memory-mapped files
+  (see module_distance.py); networks read them as they are, without
+  the square form. linkage needs a float64 copy in RAM (n^2/2 x 8
+  bytes, 3.6 GB for 30000 rows), so the linkage of such tables is
+  computed by one worker at a time (linkagelock).
+- Distances of large tables (and, with distancecache, of smaller
+  tables) are cached per table and metric; when rows are added, only
+  their distances are computed (see module_distance.py).
+- Distance networks are written as Graphviz sources and then laid
+  out by concurrent subprocesses (see module_network.py).
+- Tables of dendrolargeleaves rows or more: truncated dendrograms with
+  culled labels; the full linkage matrix (.npy) and the members of
+  flat clusters (.csv) are written next to each figure.
+- A summary index (CSV) lists each output with its table, metric,
+  method, rendering time and error, if any.
+"""
+
+#===============================================================
+
+import os, re, time
+import multiprocessing
+from contextlib import nullcontext
+import numpy as np
+import matplotlib.pyplot as plt
+import scipy.cluster.hierarchy as hy
+import scipy.spatial.distance as dist
+
+from module_parallel import parallelrun
+from module_network import distnetworks, gvrender
+from module_distance import distanceupdate
+
+from numdistnetdendro_conf import *
+
+#===============================================================
+
+"""
+# Exhaustive list for testing:
+distmetriclist = ['braycurtis', 'canberra', 'chebyshev', 'cityblock', 'correlation', 'cosine',
+	'dice', 'euclidean', 'hamming', 'jaccard', 'jensenshannon', 'kulsinski',
+	'mahalanobis', 'matching', 'minkowski', 'rogerstanimoto', 'russellrao', 'seuclidean',
+	'sokalmichener', 'sokalsneath', 'sqeuclidean', 'yule']
+"""
+
+# Short list: some of the other distance metrics yield zero or nan
+distmetriclist = [ 'canberra', 'chebyshev', 'cityblock', 'correlation', 'cosine', 'euclidean' ]
+
+methodlist = [ 'single', 'complete', 'average', 'weighted', 'centroid', 'median', 'ward' ]
+
+# Table name -> names, distances per metric and figure parameters
+dendrotables = {}
+
+# Shared by the forked workers: one linkage of a large table at a time
+linkagelock = None
+
+#===============================================================
+# Dendrogram of one metric and clustering method
+
+def dendrofigure(names, distances, dendrographname, method, figparams, showgraph):
+
+	(figwidth, figheight, boxwidth, boxheight,
+		halign, valign, orientation,
+		netname, dendroname) = figparams
+
+	# Define figure
+	fig = plt.figure(figsize=(figwidth, figheight))
+
+	ax1 = fig.add_axes([halign, valign, boxwidth, boxheight])
+	ax1.set_xlabel(dendrographname, fontsize=12)
+
+	orientation = 'left'	# Change to 'right' or 'top' if leaf labels are cut off
+
+	# Cluster calculation from distances and method
+	# (large tables: float64 copy of the distances, one worker at a time)
+	large = distanceblockedrows > 0 and len(names) >= distanceblockedrows
+	with linkagelock if large and linkagelock is not None else nullcontext():
+		Y1 = hy.linkage(distances, method=method)
+
+	if dendrolargeleaves > 0 and len(names) >= dendrolargeleaves:
+		# Large tables: truncated, with full linkage and cluster members in side files
+		dendrolarge(Y1, names, dendrographname, orientation, ax1)
+	else:
+		# Dendrogram creation from linkages and labels
+		hy.dendrogram(Y1,
+			orientation=orientation,
+			above_threshold_color='black', color_threshold=0,
+			count_sort="False", distance_sort=False,
+			labels=names, leaf_font_size=12)
+
+	plt.savefig(dendrographname + ".png")
+	if showgraph:
+		plt.show()
+
+	plt.close(fig)	# Close each graph after saving and displaying
+
+	return dendrographname + ".png"
+
+def dendrolarge(Y1, names, dendrographname, orientation, ax1):
+
+	"""
+Truncated dendrogram (dendrotruncate: 'lastp' or 'level', dendrotruncatep)
+with at most dendrolabelmax leaf labels; side files:
+	<dendrograph>-linkage.npy	full linkage matrix (rows: names as in the input table)
+	<dendrograph>-clusters.csv	members of dendroclusters flat clusters
+	"""
+
+	np.save(dendrographname + "-linkage.npy", Y1)
+
+	clusters = hy.fcluster(Y1, t=min(dendroclusters, len(names)), criterion="maxclust")
+	with open(dendrographname + "-clusters.csv", "w") as handle:
+		handle.write("cluster,size,name\n")
+		sizes = np.bincount(clusters)
+		for k in np.argsort(clusters, kind="stable"):
+			handle.write("%d,%d,%s\n"%(clusters[k], sizes[clusters[k]], names[k]))
+
+	# Truncated: singleton leaves are labelled with their name, clusters with (size)
+	truncation = dict(truncate_mode=dendrotruncate, p=dendrotruncatep,
+		count_sort="False", distance_sort=False)
+	leaves = hy.dendrogram(Y1, no_plot=True, **truncation)["leaves"]
+
+	# Label culling: every step-th leaf, at most as many as fit (8 pt) and dendrolabelmax
+	fontsize = 8
+	width, height = ax1.get_window_extent().width, ax1.get_window_extent().height
+	room = (height if orientation in [ 'left', 'right' ] else width) / ax1.figure.dpi * 72
+	step = int(np.ceil(len(leaves) / max(1, min(dendrolabelmax, int(room / (1.2*fontsize))))))
+	shown = set(leaves[::step])
+
+	def leaflabel(leaf):
+		if leaf not in shown: return ""
+		return names[leaf] if leaf < len(names) else "(%d)"%Y1[leaf-len(names), 3]
+
+	hy.dendrogram(Y1,
+		orientation=orientation,
+		above_threshold_color='black', color_threshold=0,
+		leaf_label_func=leaflabel, leaf_font_size=fontsize, **truncation)
+
+	return
+
+#===============================================================
+# Tasks: distances computed once per table and metric
+
+def dendrotasks(names, data, netname, dendroname, figparams, mindistance, maxdistance, jobs=1):
+
+	"""Computes the distance tables, returns the rendering tasks."""
+
+	tablename = re.sub(".*/", "", re.sub("-dendro$", "", dendroname))
+	large = distanceblockedrows > 0 and len(data) >= distanceblockedrows
+	print("----> Similarity types:", ", ".join(distmetriclist))
+	if large or distancecache:
+		# Cached; large tables blocked, parallel, float32 (see module_distance.py)
+		distances = distanceupdate(names, data, distmetriclist,
+			{ distmetric: "%s/%s-%s.npy"%(distancedirectory, tablename, distmetric)
+				for distmetric in distmetriclist },
+			jobs, distanceblockbytes, np.float32 if large else np.float64, distancefused)
+	else:
+		# Smaller tables: exact, in RAM, no files
+		distances = { distmetric: dist.pdist(data, metric=distmetric) for distmetric in distmetriclist }
+
+	return dendrotable(tablename, names, data, distances,
+		netname, dendroname, figparams, mindistance, maxdistance)
+
+def dendrotable(tablename, names, data, distances, netname, dendroname, figparams, mindistance, maxdistance):
+
+	"""Registers a table's distances (metric: condensed matrix), returns its tasks."""
+
+	dendrotables[tablename] = {
+		"names": names, "data": data, "distances": distances,
+		"netname": netname, "dendroname": dendroname, "figparams": figparams,
+		"mindistance": mindistance, "maxdistance": maxdistance }
+
+	tasks = []
+	for distmetric in distances:
+		tasks += [ (tablename, distmetric, "network") ]
+		tasks += [ (tablename, distmetric, method) for method in methodlist ]
+
+	return tasks
+
+def dendrotask(task, showgraph=False):
+
+	"""Renders one network or dendrogram, returns the output file name."""
+
+	tablename, distmetric, method = task
+	table = dendrotables[tablename]
+	distances = table["distances"][distmetric]
+
+	if method == "network":
+		return distnetworks(table["names"], table["data"], distances, table["netname"],
+			distmetric, table["mindistance"], table["maxdistance"])
+
+	dendrographname = "%-s-%s-%s"%(table["dendroname"], distmetric, method)
+	return dendrofigure(table["names"], distances, dendrographname, method,
+		table["figparams"], showgraph)
+
+#===============================================================
+# Rendering, sequential or in a process pool, and summary index
+
+def dendrorun(tasks, jobs=1, showgraph=False, indexfilename=None):
+
+	"""Renders all tasks; returns index rows in task order."""
+
+	workers = max(1, min(jobs, len(tasks)))
+	if workers > 1 or not showgraph:
+		plt.switch_backend("Agg")	# headless; before the workers are forked
+	if workers > 1 and showgraph:
+		print("Note: showgraph is ignored with more than one job.")
+
+	global linkagelock
+	if workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+		linkagelock = multiprocessing.get_context("fork").Lock()
+
+	results = {}
+
+	def collecttask(task, timedresult, error):
+		tablename, distmetric, method = task
+		print("===> Similarity type:", distmetric, "Clustering method:", method, "(%s)"%tablename)
+		if error is not None:
+			print("Error:", tablename, distmetric, method, "%s: %s"%(type(error).__name__, error))
+		results[task] = (timedresult, error)
+		return
+
+	if workers > 1:
+		parallelrun(tasks, dendrotask, collecttask, workers)
+	else:
+		for task in tasks:
+			start = time.time()
+			try:
+				timedresult, error = (dendrotask(task, showgraph), time.time() - start), None
+			except Exception as taskerror:
+				timedresult, error = None, taskerror
+			collecttask(task, timedresult, error)
+
+	# Deferred networks: concurrent layout of the .gv sources
+	gvfilenames = [ results[task][0][0] for task in tasks
+		if results[task][1] is None and results[task][0][0].endswith(".gv") ]
+	if gvfilenames:
+		rendered = gvrender(gvfilenames, gvjobs)
+		for task in tasks:
+			timedresult, error = results[task]
+			if error is None and timedresult[0] in rendered:
+				pngfilename, seconds, error = rendered[timedresult[0]]
+				results[task] = ((pngfilename, timedresult[1] + seconds), error)
+
+	rows = []
+	for task in tasks:
+		timedresult, error = results[task]
+		outputname, seconds = timedresult if error is None else ("", 0.0)
+		rows += [ list(task) + [ outputname, "%.3f"%seconds,
+			"" if error is None else "%s: %s"%(type(error).__name__, error) ] ]
+
+	if indexfilename is not None:
+		dendroindexwrite(indexfilename, rows)
+
+	return rows
+
+def dendroindexwrite(indexfilename, rows):
+
+	os.makedirs(os.path.dirname(indexfilename) or ".", exist_ok=True)
+	with open(indexfilename, "w") as handle:
+		handle.write("table,metric,method,output,seconds,error\n")
+		for row in rows:
+			handle.write(",".join([ str(cell).replace(",", ";") for cell in row ]) + "\n")
+	print("Index: %s, %d outputs, %d errors"%(
+		indexfilename, len(rows), len([ row for row in rows if row[-1] != "" ])))
+
+	return
+
+#===============================================================
+# EOF
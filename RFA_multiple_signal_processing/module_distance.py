@@ -0,0 +1,318 @@
+# module_distance.py
+# D. Gibbon
+# Created 2022-07-20
+# Blocked distance module for numdistnetdendro.py
+
+"""
+Pairwise distances of large tables, computed in blocks
+
+- The condensed distance matrix (the upper triangle, row by row, as
+  returned by pdist) is written as float32 to a memory-mapped .npy
+  file; the square n x n form is never created.
+- Rows are processed in blocks: the distances of block rows a..b-1 to
+  all rows a..n-1 are one tile, whose upper triangle is exactly the
+  contiguous part condensedstart(n, a) .. condensedstart(n, b) of the
+  condensed matrix. The block height keeps the tiles within
+  distanceblockbytes.
+- Blocks are computed in a process pool (see module_parallel.py); the
+  forked workers write into the shared memory-mapped files.
+- All metrics are computed together, tile by tile (fused kernel):
+  cosine and euclidean from one Gram matrix product X.Y' with the
+  norms of the rows, correlation from the product of the centred rows
+  (as pdist, without cancellation for large row means); the others,
+  including canberra, chebyshev and cityblock, by cdist on the same
+  tile.
+  Without fusion, every metric is computed by cdist, with exactly the
+  values of pdist.
+
+Distance cache, one matrix per table and metric:
+	<table>-<metric>.npy		condensed distance matrix
+	<table>-<metric>-rows.npy	name and key (name and content hash) of each row
+- Unchanged rows: the cached matrix is used as it is.
+- Rows added (or changed): only the distances of the new rows to all
+  rows are computed; the distances between cached rows are copied.
+- A cached matrix, or any condensed (or square) distance matrix .npy,
+  with an optional -rows.npy file, is also an input in its own right
+  (distanceread).
+"""
+
+#===============================================================
+
+import os, re, hashlib
+import numpy as np
+import scipy.spatial.distance as dist
+
+from module_parallel import parallelrun
+
+#===============================================================
+# Condensed matrix layout
+
+def condensedstart(n, i):
+
+	"""Position of the distance (i, i+1) in the condensed matrix of n rows."""
+
+	return n*i - i*(i+1)//2
+
+def condensedrows(size):
+
+	"""Number of rows of a condensed matrix of size distances."""
+
+	return int(round((1 + np.sqrt(1 + 8*size)) / 2))
+
+def distanceblocks(n, blockbytes, tilecount=1):
+
+	"""Row blocks; tilecount (n-wide float64) tiles per block within blockbytes."""
+
+	rows = max(1, int(blockbytes // (8 * max(n, 1) * tilecount)))
+
+	return [ (a, min(a+rows, n-1)) for a in range(0, n-1, rows) ]
+
+#===============================================================
+# Fused kernel: all metrics of a tile in one pass
+
+grammetrics = [ "correlation", "cosine", "euclidean" ]
+
+def distancetiles(X, Y, metrics, fused=True):
+
+	"""Distances of the rows of X to the rows of Y, { metric: tile }."""
+
+	tiles = {}
+	if fused and len([ metric for metric in metrics if metric in grammetrics ]) > 0:
+		# One Gram matrix product, with norms and means of the rows
+		gram = X @ Y.T
+		xx, yy = np.einsum("ij,ij->i", X, X), np.einsum("ij,ij->i", Y, Y)
+		with np.errstate(divide="ignore", invalid="ignore"):
+			if "euclidean" in metrics:
+				squared = xx[:, np.newaxis] + yy[np.newaxis, :] - 2 * gram
+				# Cancellation near zero: such (near-duplicate) pairs exactly
+				r, c = np.nonzero(squared <= 1e-6 * (xx[:, np.newaxis] + yy[np.newaxis, :]))
+				squared[r, c] = np.sum((X[r] - Y[c])**2, axis=1)
+				tiles["euclidean"] = np.sqrt(np.maximum(squared, 0))
+			if "cosine" in metrics:
+				tiles["cosine"] = np.clip(1 - gram / np.sqrt(np.outer(xx, yy)), 0, 2)
+			if "correlation" in metrics:
+				# Centred rows, as pdist: no cancellation for large means
+				Xc, Yc = X - X.mean(axis=1)[:, np.newaxis], Y - Y.mean(axis=1)[:, np.newaxis]
+				centred = Xc @ Yc.T
+				xvar, yvar = np.einsum("ij,ij->i", Xc, Xc), np.einsum("ij,ij->i", Yc, Yc)
+				tiles["correlation"] = np.clip(1 - centred / np.sqrt(np.outer(xvar, yvar)), 0, 2)
+
+	for metric in metrics:
+		if metric not in tiles:
+			tiles[metric] = dist.cdist(X, Y, metric=metric)
+
+	return tiles
+
+#===============================================================
+# One block of rows; in a worker, the job is inherited from the parent
+
+distancejob = {}
+
+def distanceblock(block):
+
+	data, metrics, fused = distancejob["data"], distancejob["metrics"], distancejob["fused"]
+	old, oldindex = distancejob["old"], distancejob["oldindex"]
+	n = len(data)
+	a, b = block
+
+	if old is None:
+		tiles = distancetiles(data[a:b], data[a:], metrics, fused)
+	else:
+		# Pairs of cached rows: copied; pairs with a new row: computed
+		rowold, colold = oldindex[a:b], oldindex[a:]
+		tiles = { metric: np.empty((b-a, n-a)) for metric in metrics }
+		r, c = np.flatnonzero(rowold >= 0), np.flatnonzero(colold >= 0)
+		if len(r) > 0 and len(c) > 0:
+			i, j = rowold[r][:, np.newaxis], colold[c][np.newaxis, :]
+			lower, upper = np.minimum(i, j), np.maximum(i, j)
+			for metric in metrics:
+				position = np.where(upper > lower,
+					condensedstart(condensedrows(len(old[metric])), lower) + upper - lower - 1, 0)
+				tiles[metric][np.ix_(r, c)] = old[metric][position]
+		r, c = np.flatnonzero(rowold < 0), np.flatnonzero(colold < 0)
+		if len(c) > 0:
+			for metric, tile in distancetiles(data[a:b], data[a:][c], metrics, fused).items():
+				tiles[metric][:, c] = tile
+		if len(r) > 0:
+			for metric, tile in distancetiles(data[a:b][r], data[a:], metrics, fused).items():
+				tiles[metric][r, :] = tile
+
+	upper = np.arange(n-a)[np.newaxis, :] > np.arange(b-a)[:, np.newaxis]
+	for metric in metrics:
+		distancejob["distances"][metric][condensedstart(n, a):condensedstart(n, b)] = tiles[metric][upper]
+
+	return None
+
+#===============================================================
+
+def distancematrices(data, metrics, filenames=None, jobs=1, blockbytes=2**26,
+	dtype=np.float32, fused=True, old=None, oldindex=None):
+
+	"""
+Condensed distance matrices (default float32) of the rows of data,
+{ metric: matrix }: read-only memory-mapped .npy files if filenames
+({ metric: filename }) are given, else arrays. Blocks are computed in
+parallel only with files, which the workers share. With cached matrices
+old ({ metric: matrix }), oldindex is the old row of each row (-1: new).
+	"""
+
+	data = np.asarray(data, dtype=np.float64)
+	n = len(data)
+	size = n*(n-1)//2
+
+	distances = {}
+	for metric in metrics:
+		if filenames is None or size == 0:
+			distances[metric] = np.empty(size, dtype=dtype)
+		else:
+			os.makedirs(os.path.dirname(filenames[metric]) or ".", exist_ok=True)
+			distances[metric] = np.lib.format.open_memmap(filenames[metric],
+				mode="w+", dtype=dtype, shape=(size,))
+	if size == 0: filenames = None
+
+	blocks = distanceblocks(n, blockbytes, len(metrics) + 3)
+	distancejob.update(data=data, metrics=metrics, fused=fused, distances=distances,
+		old=old, oldindex=oldindex)
+	errors = []
+
+	def collectblock(block, timedresult, error):
+		if error is not None: errors.append(error)
+		return
+
+	try:
+		workers = max(1, min(jobs, len(blocks)))
+		if filenames is not None and workers > 1:
+			parallelrun(blocks, distanceblock, collectblock, workers)
+			if errors: raise errors[0]
+		else:
+			for block in blocks:
+				distanceblock(block)
+	finally:
+		distancejob.clear()
+
+	if filenames is None:
+		return distances
+
+	for metric in metrics:
+		distances[metric].flush()
+	del distances
+
+	return { metric: np.load(filenames[metric], mmap_mode="r") for metric in metrics }
+
+def distancematrix(data, metric, filename=None, jobs=1, blockbytes=2**26, dtype=np.float32, fused=True):
+
+	"""Condensed distance matrix of one metric (see distancematrices)."""
+
+	return distancematrices(data, [ metric ], None if filename is None else { metric: filename },
+		jobs, blockbytes, dtype, fused)[metric]
+
+#===============================================================
+# Distance cache
+
+def distancerowsfilename(filename):
+
+	return re.sub(r"\.npy$", "", filename) + "-rows.npy"
+
+def distancerowkeys(names, data, fused=True):
+
+	"""Row identity: hash of the name and the (equalised) values of each row, and the kernel."""
+
+	data = np.ascontiguousarray(data, dtype=np.float64)
+	kernel = b"fused-centred" if fused else b"cdist"	# cached fused distances of before are recomputed
+
+	return [ hashlib.sha1(name.encode("utf8") + row.tobytes() + kernel).hexdigest()
+		for name, row in zip(names, data) ]
+
+def distanceupdate(names, data, metrics, filenames, jobs=1, blockbytes=2**26, dtype=np.float32, fused=True):
+
+	"""
+Cached condensed distances { metric: matrix } (filenames: { metric: filename }),
+computing only the distances of new rows; metrics with the same cached
+rows are computed together.
+	"""
+
+	if len(names) < 2: return distancematrices(data, metrics, None, jobs, blockbytes, dtype, fused)
+
+	keys = distancerowkeys(names, data, fused)
+	distances = {}
+	groups = {}	# cached rows (or None) -> metrics and cached matrices
+
+	for metric in metrics:
+		filename, rowsfilename = filenames[metric], distancerowsfilename(filenames[metric])
+		oldkeys, cached = None, None
+		if os.path.exists(filename) and os.path.exists(rowsfilename):
+			oldkeys = np.load(rowsfilename)["key"].tolist()
+			cached = np.load(filename, mmap_mode="r")
+			oldcount = len(oldkeys)
+			if cached.dtype != dtype or cached.shape != (oldcount*(oldcount-1)//2,) or oldcount < 2:
+				oldkeys = None
+			elif oldkeys == keys:
+				print("Distances: %s (cached)"%filename)
+				distances[metric] = cached
+				continue
+		group = groups.setdefault(None if oldkeys is None else tuple(oldkeys), ([], {}))
+		group[0].append(metric)
+		group[1][metric] = cached
+
+	for oldkeys, (groupmetrics, old) in groups.items():
+		oldindex = None
+		if oldkeys is not None:
+			position = { key: k for k, key in enumerate(oldkeys) }
+			oldindex = np.array([ position.get(key, -1) for key in keys ], dtype=np.int64)
+			if not np.any(oldindex >= 0): oldindex = None
+		newcount = len(keys) if oldindex is None else int(np.sum(oldindex < 0))
+		for metric in groupmetrics:
+			print("Distances: %s (%d of %d rows computed)"%(filenames[metric], newcount, len(keys)))
+
+		tmpfilenames = { metric: "%s.tmp%d.npy"%(re.sub(r"\.npy$", "", filenames[metric]), os.getpid())
+			for metric in groupmetrics }
+		distancematrices(data, groupmetrics, tmpfilenames, jobs, blockbytes, dtype, fused,
+			None if oldindex is None else old, oldindex)
+
+		for metric in groupmetrics:
+			distances[metric] = distancereplace(tmpfilenames[metric], filenames[metric], names, keys)
+
+	return { metric: distances[metric] for metric in metrics }
+
+def distancereplace(tmpfilename, filename, names, keys):
+
+	"""New matrix in place of the cached one; rows file last, so that
+a matrix without its rows file is computed anew."""
+
+	rowsfilename = distancerowsfilename(filename)
+	if os.path.exists(rowsfilename): os.remove(rowsfilename)
+	os.replace(tmpfilename, filename)
+
+	rows = np.zeros(len(keys), dtype=[ ("name", "U%d"%max([ len(name) for name in names ] + [1])), ("key", "U40") ])
+	rows["name"] = names
+	rows["key"] = keys
+	tmpfilename = "%s.tmp%d.npy"%(re.sub(r"\.npy$", "", rowsfilename), os.getpid())
+	np.save(tmpfilename, rows)
+	os.replace(tmpfilename, rowsfilename)
+
+	return np.load(filename, mmap_mode="r")
+
+#===============================================================
+# Precomputed distances as input
+
+def distanceread(filename):
+
+	"""Names and condensed distances of a condensed (or square) matrix .npy file."""
+
+	distances = np.load(filename, mmap_mode="r")
+	if distances.ndim == 2:
+		distances = dist.squareform(np.asarray(distances), checks=False)
+	n = condensedrows(len(distances))
+
+	rowsfilename = distancerowsfilename(filename)
+	if os.path.exists(rowsfilename):
+		names = np.load(rowsfilename)["name"].tolist()
+	else:
+		names = [ "%d"%(k+1) for k in range(n) ]
+	if len(names) != n or len(distances) != n*(n-1)//2:
+		raise ValueError("%s: not a condensed distance matrix of %d rows"%(filename, len(names)))
+
+	return names, distances
+
+#===============================================================
+# EOF
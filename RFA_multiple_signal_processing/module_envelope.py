@@ -0,0 +1,200 @@
+# module_envelope.py
+# D. Gibbon
+# Created 2022-07-20
+# Multi-rate AM envelope extraction module for rfa.py
+
+"""
+AM demodulation (envelope extraction) at a low sampling rate
+
+Method:
+	- full-wave rectification, i.e. np.abs(signal)
+	- decimation in stages, each stage with a Butterworth anti-aliasing
+	  low pass filter in second-order sections (SOS) form
+	- final Butterworth low pass filter (SOS) at the low rate
+The envelope is returned together with its sampling rate, so that the
+LF spectrum FFT runs on thousands rather than millions of points.
+The same chain can be run block by block with carried filter state.
+Low cutoff frequencies are numerically fragile in (b, a) form at audio
+sampling rates; in SOS form and at the low rate they are not.
+
+Multi-band mode:
+	- FIR band pass filterbank, one row of coefficients per band
+	- all bands filtered in one batched FFT convolution
+	- envelopes of all bands rectified and decimated in one pass
+	- LF spectra of all bands as one 2-D FFT (bands x frequencies)
+"""
+
+#===============================================================
+
+import numpy as np
+from scipy.signal import butter, sosfilt, firwin, oaconvolve
+
+#===============================================================
+# Decimation stage factors
+
+def decimationstages(fs, envfsmin, stagemax):
+
+	"""
+Integer decimation factors, each at most stagemax, such that the
+rate after every stage stays at or above envfsmin.
+	"""
+
+	stages = []
+	while True:
+		factor = min(stagemax, int(fs // envfsmin))
+		if factor < 2: break
+		stages += [ factor ]
+		fs = fs / factor
+
+	return stages
+
+#===============================================================
+# Filter design for the complete chain
+
+def envelopefilters(fs, envfsmin, cutoff, order, stagemax=10, stageorder=8):
+
+	stages = decimationstages(fs, envfsmin, stagemax)
+	stagesos = [
+		butter(stageorder, 0.8 / factor, btype="low", output="sos")
+		for factor in stages ]
+	envfs = fs / np.prod(stages)
+	lowpasssos = butter(order, cutoff / (0.5 * envfs), btype="low", output="sos")
+
+	return stages, stagesos, lowpasssos, envfs
+
+#===============================================================
+# Multi-stage rectify, decimate, filter
+
+def amenvelope(signal, fs, envfsmin, cutoff, order, stagemax=10, stageorder=8):
+
+	"""
+Rectify, decimate in stages down to a rate of at least envfsmin Hz,
+then low pass filter at cutoff Hz.
+The signal may be 1-D or 2-D, (channels, samples); the time axis is last.
+Returns the envelope and its sampling rate.
+	"""
+
+	stages, stagesos, lowpasssos, envfs = envelopefilters(
+		fs, envfsmin, cutoff, order, stagemax, stageorder)
+
+	envelope = np.abs(signal)
+	for factor, sos in zip(stages, stagesos):
+		envelope = sosfilt(sos, envelope, axis=-1)[..., ::factor]
+	envelope = sosfilt(lowpasssos, envelope, axis=-1)
+
+	return envelope, envfs
+
+#===============================================================
+# Block-wise (streamed) envelope extraction with carried filter state
+# Every block except the last must be a multiple of state["factor"]
+# samples long, so that each decimation stage keeps its phase.
+# The result is identical to amenvelope() on the complete signal.
+
+def amenvelopestreamstart(fs, envfsmin, cutoff, order, stagemax=10, stageorder=8):
+
+	stages, stagesos, lowpasssos, envfs = envelopefilters(
+		fs, envfsmin, cutoff, order, stagemax, stageorder)
+
+	state = {
+		"stages": stages, "stagesos": stagesos, "lowpasssos": lowpasssos,
+		"envfs": envfs, "factor": int(np.prod(stages)),
+		"zi": [ np.zeros((sos.shape[0], 2)) for sos in stagesos + [lowpasssos] ],
+		"envelope": [] }
+
+	return state
+
+def amenvelopestreamblock(state, block):
+
+	envelope = np.abs(block)
+	for k, (factor, sos) in enumerate(zip(state["stages"], state["stagesos"])):
+		envelope, state["zi"][k] = sosfilt(sos, envelope, zi=state["zi"][k])
+		envelope = envelope[::factor]
+	envelope, state["zi"][-1] = sosfilt(
+		state["lowpasssos"], envelope, zi=state["zi"][-1])
+	state["envelope"] += [ envelope ]
+
+	return
+
+def amenvelopestreamend(state):
+
+	return np.concatenate(state["envelope"]), state["envfs"]
+
+#===============================================================
+# FIR band pass filterbank
+
+def nyqvistbands(fs, bands):
+
+	"""The bands whose low edge is below the Nyquist frequency, e.g. at low sampling rates."""
+
+	return [ (low, high) for low, high in bands if low < 0.5 * fs ]
+
+def bandfilterbank(fs, bands, taps):
+
+	"""
+One row of FIR coefficients per (low, high) band in Hz.
+A band edge at 0 Hz or at or above the Nyquist frequency makes
+a low pass or a high pass filter respectively. Bands from the
+Nyquist frequency up are skipped (see nyqvistbands).
+	"""
+
+	nyqvist = 0.5 * fs
+	bank = []
+	for low, high in nyqvistbands(fs, bands):
+		if low <= 0:
+			h = firwin(taps, min(high, 0.99 * nyqvist), fs=fs)
+		elif high >= nyqvist:
+			h = firwin(taps, low, pass_zero="highpass", fs=fs)
+		else:
+			h = firwin(taps, [low, high], pass_zero="bandpass", fs=fs)
+		bank += [ h ]
+
+	return np.array(bank)
+
+#===============================================================
+# Band-wise envelopes and LF spectra
+
+def ambandenvelopes(signal, fs, bands, taps, envfsmin, cutoff, order):
+
+	"""
+Split a signal into bands, then extract all band envelopes at once.
+Returns a (bands, samples) envelope array and its sampling rate,
+or (channels, bands, samples) for a (channels, samples) signal.
+	"""
+
+	bank = bandfilterbank(fs, bands, taps)
+	if len(bank) == 0:
+		raise ValueError("No AM band below the Nyquist frequency (%g Hz)"%(0.5 * fs))
+	shape = signal.shape[:-1] + (len(bank), signal.shape[-1])
+	bank = bank.reshape((1,) * (signal.ndim-1) + bank.shape)
+	bandsignals = np.broadcast_to(signal[..., np.newaxis, :], shape)
+	bandsignals = oaconvolve(bandsignals, bank, mode="same", axes=-1)
+
+	return amenvelope(bandsignals, fs, envfsmin, cutoff, order)
+
+def ambandspectra(signal, fs, bands, taps, envfsmin, cutoff, order, specfreqmax):
+
+	"""
+LF spectra of all band envelopes, computed as one batched FFT.
+Returns (bands, frequencies) magnitudes scaled to 0...1 per band,
+or (channels, bands, frequencies) for a (channels, samples) signal,
+and the frequencies, DC excluded as in the broadband LF spectrum.
+Only bands below the Nyquist frequency, nyqvistbands(fs, bands).
+	"""
+
+	envelopes, envfs = ambandenvelopes(
+		signal, fs, bands, taps, envfsmin, cutoff, order)
+
+	specmags = np.abs(np.fft.rfft(envelopes, axis=-1))
+	specmaglen = specmags.shape[-1]
+	lfspecmaglen = int(round(specfreqmax * specmaglen / (envfs / 2)))
+	lfspecmags = specmags[..., 1:lfspecmaglen]	# DC cutoff
+	lfspecfreqs = np.linspace(0, envfs/2, specmaglen)[1:lfspecmaglen]
+
+	magmin = np.min(lfspecmags, axis=-1, keepdims=True)
+	magmax = np.max(lfspecmags, axis=-1, keepdims=True)
+	lfspecmags = (lfspecmags - magmin) / (magmax - magmin)
+
+	return lfspecmags, lfspecfreqs
+
+#===============================================================
+# EOF
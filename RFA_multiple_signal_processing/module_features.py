@@ -0,0 +1,184 @@
+# module_features.py
+# D. Gibbon
+# Created 2022-07-20
+# Feature store module for rfa_mult.py and numdistnetdendro.py
+
+"""
+Feature store: all property vectors of all files in one file
+
+Format: NumPy .npz archive; for each feature (e.g. lfammaxfreqs):
+	<feature>_names		row names (file name, or file name and channel)
+	<feature>_values	all vectors of the feature, concatenated
+	<feature>_offsets	start of each row in _values, plus the end
+	featurenames		list of features in the store
+The vectors of one feature may differ in length (ragged rows);
+row k is values[offsets[k]:offsets[k+1]].
+Values are stored as float16, float32 or float64.
+Stores can be merged without recomputation, and exported as the
+CSV files which rfa_mult.py used to write row by row.
+"""
+
+#===============================================================
+
+import os, re
+import numpy as np
+
+#===============================================================
+# Empty feature collection: feature -> (row names, vectors)
+
+def featurecollection(featurenames):
+
+	return { featurename: ([], []) for featurename in featurenames }
+
+def featureappend(features, featurename, rowname, vector):
+
+	names, vectors = features.setdefault(featurename, ([], []))
+	names += [ rowname ]
+	vectors += [ np.asarray(vector, dtype=np.float64).ravel() ]
+
+	return
+
+def featureextend(features, morefeatures):
+
+	for featurename, (morenames, morevectors) in morefeatures.items():
+		names, vectors = features.setdefault(featurename, ([], []))
+		names += morenames
+		vectors += morevectors
+
+	return
+
+#===============================================================
+# Write and read
+
+def featurestorewrite(storefilename, features, precision="float32", compress=True):
+
+	arrays = {}
+	featurenames = [ f for f in features if len(features[f][0]) > 0 ]
+	for featurename in featurenames:
+		names, vectors = features[featurename]
+		lengths = [ len(vector) for vector in vectors ]
+		arrays[featurename+"_names"] = np.array(names, dtype=str)
+		arrays[featurename+"_offsets"] = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+		arrays[featurename+"_values"] = np.concatenate(vectors).astype(precision)
+	arrays["featurenames"] = np.array(featurenames, dtype=str)
+
+	# Atomic: written under a temporary name, then renamed
+	tmpfilename = "%s.tmp%d"%(storefilename, os.getpid())
+	with open(tmpfilename, "wb") as handle:
+		if compress:
+			np.savez_compressed(handle, **arrays)
+		else:
+			np.savez(handle, **arrays)
+	os.replace(tmpfilename, storefilename)
+
+	return
+
+def featurestorenames(storefilename):
+
+	with np.load(storefilename) as store:
+		return store["featurenames"].tolist()
+
+def featurestoreread(storefilename, featurenames=None):
+
+	"""
+Returns feature -> (row names, vectors) for the requested features
+(all features if None). Only the requested arrays are decompressed.
+	"""
+
+	features = {}
+	with np.load(storefilename) as store:
+		if featurenames is None: featurenames = store["featurenames"].tolist()
+		for featurename in featurenames:
+			names = store[featurename+"_names"].tolist()
+			offsets = store[featurename+"_offsets"]
+			values = store[featurename+"_values"]
+			vectors = [ values[start:stop] for start, stop in zip(offsets[:-1], offsets[1:]) ]
+			features[featurename] = (names, vectors)
+
+	return features
+
+def featurematrix(storefilename, featurename):
+
+	"""
+Returns the row names and a dense (rows, values) matrix, read as one
+block, for a feature whose rows all have the same length
+(e.g. with fixed grids, see rfa_mult_conf.py).
+	"""
+
+	with np.load(storefilename) as store:
+		names = store[featurename+"_names"].tolist()
+		lengths = np.diff(store[featurename+"_offsets"])
+		if len(set(lengths.tolist())) > 1:
+			raise ValueError("%s: rows of different lengths"%featurename)
+		matrix = store[featurename+"_values"].reshape(len(names), -1)
+
+	return names, matrix
+
+#===============================================================
+# Merge several stores
+# A row name in more than one store with different values (e.g. the
+# same WAV file name in two corpus directories) is a clash:
+#	duplicates="error"	ValueError listing the clashes (default)
+#	duplicates="later"	the row of the later store is kept, with a warning
+#	duplicates="qualify"	all rows are kept, as <store>:<name>
+# Rows with the same name and the same values are kept once.
+
+def featurestoremerge(storefilenames, outfilename, precision="float32", compress=True, duplicates="error"):
+
+	if duplicates not in [ "error", "later", "qualify" ]:
+		raise ValueError("duplicates: 'error', 'later' or 'qualify', not %r"%duplicates)
+
+	# feature -> row name -> [ (store, vector), ... ]
+	merged = {}
+	for storefilename in storefilenames:
+		store = re.sub(r"\.npz$", "", storefilename)
+		for featurename, (names, vectors) in featurestoreread(storefilename).items():
+			rows = merged.setdefault(featurename, {})
+			for name, vector in zip(names, vectors):
+				rows.setdefault(name, [])
+				if not any([ np.array_equal(vector, other) for _, other in rows[name] ]):
+					rows[name] += [ (store, vector) ]
+
+	clashes = [ "%s %s (%s)"%(featurename, name, ", ".join([ store for store, _ in entries ]))
+		for featurename, rows in merged.items()
+		for name, entries in rows.items() if len(entries) > 1 ]
+	if len(clashes) > 0:
+		if duplicates == "error":
+			raise ValueError("Row names in several stores with different values"
+				" (use duplicates 'later' or 'qualify'): %d, e.g. %s"%(len(clashes), "; ".join(clashes[:5])))
+		print("Warning: %d row names in several stores with different values, %s"%(len(clashes),
+			"the later store's row kept" if duplicates == "later" else "kept as <store>:<name>"))
+
+	features = {}
+	for featurename, rows in merged.items():
+		names, vectors = [], []
+		for name, entries in rows.items():
+			if len(entries) == 1 or duplicates == "later":
+				names += [ name ]
+				vectors += [ entries[-1][1] ]
+			else:
+				names += [ "%s:%s"%(store, name) for store, _ in entries ]
+				vectors += [ vector for _, vector in entries ]
+		features[featurename] = (names, vectors)
+	featurestorewrite(outfilename, features, precision, compress)
+
+	return features
+
+#===============================================================
+# CSV export: one CSV file per feature, each written in one go
+
+def featurecsvexport(features, csvdirectory, separator):
+
+	for featurename, (names, vectors) in features.items():
+		if len(names) == 0: continue
+		lines = [
+			name + separator + separator.join(map(str, vector.tolist()))
+			for name, vector in zip(names, vectors) ]
+		handle = open("%s/%s.csv"%(csvdirectory, featurename), "w")
+		handle.write("\n".join(lines) + "\n")
+		handle.close()
+
+	return
+
+#===============================================================
+# EOF
@@ -0,0 +1,163 @@
+# module_frames.py
+# D. Gibbon
+# Created 2022-07-20
+# Frame-synchronous feature module for rfa_frames.py
+
+"""
+Frame-synchronous AM and FM features at one common frame rate
+
+Per frame, in this column order:
+	envelope	AM envelope (multi-rate, see module_envelope.py)
+	f0		F0 track (AMDF, see module_F0.py)
+	am_<f>Hz	AM LF spectrogram row, on a fixed frequency grid
+	fm_<f>Hz	FM LF spectrogram row, on a fixed frequency grid
+All tracks are linearly interpolated to the common frame times;
+spectrogram rows are placed at the centres of their windows, and
+before the first and after the last centre the edge rows are held.
+
+Output: a (frames, features) float32 tensor of all items (files, or
+channels of multichannel files) as one memory-mappable .npy file,
+and a ragged index .npy with name, offset and frame count per item:
+item k is tensor[offset[k]:offset[k]+frames[k]].
+The frame count of each item is known from the WAV header, so the
+tensor is allocated in advance and items are written in any order.
+"""
+
+#===============================================================
+
+import re, json
+import numpy as np
+
+import module_analysis
+from module_analysis import rfaread
+from module_envelope import amenvelope
+from module_F0 import f0estimatechannels
+from module_spectrogram import spectrogramarray, spectrogramwindows
+
+from rfa_mult_conf import *
+
+#===============================================================
+# Common time and frequency grids
+
+def framecount(seconds, framerate):
+
+	return int(seconds * framerate)
+
+def framecolumns(bins):
+
+	amgrid = np.linspace(amspecfreqmin, amspecfreqmax, bins)
+	fmgrid = np.linspace(fmspecfreqmin, fmspecfreqmax, bins)
+	columns = [ "envelope", "f0" ]
+	columns += [ "am_%.3gHz"%f for f in amgrid ]
+	columns += [ "fm_%.3gHz"%f for f in fmgrid ]
+
+	return columns, amgrid, fmgrid
+
+#===============================================================
+# Linear interpolation of (time, ...) arrays to new times, vectorised
+
+def frameresample(newtimes, times, values):
+
+	"""Rows of values at times -> rows at newtimes (edge rows held)."""
+
+	values = np.asarray(values)
+	if len(times) == 1: return np.repeat(values[:1], len(newtimes), axis=0)
+	position = np.interp(newtimes, times, np.arange(len(times)))
+	lower = np.minimum(np.floor(position).astype(int), len(times)-2)
+	weight = (position - lower).reshape((-1,) + (1,) * (values.ndim-1))
+
+	return values[lower] * (1-weight) + values[lower+1] * weight
+
+def spectrogramtimes(signallength, fs):
+
+	dsfs, windowlen, counterstart = spectrogramwindows(
+		signallength, fs, specdownsample, specwindowsecs, specstrides)
+
+	return (counterstart + windowlen/2) / dsfs
+
+#===============================================================
+# Frame features of one file: one (frames, features) array per channel
+
+def rfaframes(wavfilename, audio=None, framerate=100, bins=16):
+
+	wavfilebase = re.sub(".*/", "", wavfilename)
+	if audio is None: audio = rfaread(wavfilename)
+	fs, signal = audio
+	channelcount, signallength = signal.shape
+
+	columns, amgrid, fmgrid = framecolumns(bins)
+	times = np.arange(framecount(signallength / fs, framerate)) / framerate
+
+	envelope, envfs = amenvelope(signal, fs, envelopefsmin, envelopecutoff, envelopeorder)
+	f0array, f0rate, f0frameduration = f0estimatechannels(
+		signal, fs, module_analysis.channelworkers)
+	ammags, amfreqs, amtrajmags, amtrajfreqs = spectrogramarray(
+		signal, fs, amspecfreqmin, amspecfreqmax,
+		specdownsample, spectrumpower, specwindowsecs, specstrides)
+	fmmags, fmfreqs, fmtrajmags, fmtrajfreqs = spectrogramarray(
+		f0array, f0rate, fmspecfreqmin, fmspecfreqmax,
+		specdownsample, spectrumpower, specwindowsecs, specstrides)
+
+	envtimes = np.arange(envelope.shape[-1]) / envfs
+	f0times = np.arange(f0array.shape[-1]) / f0rate
+	amtimes = spectrogramtimes(signallength, fs)
+	fmtimes = spectrogramtimes(f0array.shape[-1], f0rate)
+
+	items = []
+	for c in range(channelcount):
+		rowname = wavfilebase if channelcount == 1 else "%s:ch%d"%(wavfilebase, c+1)
+		# Spectrogram rows: fixed frequency grid, then common frame times
+		amrows = frameresample(amgrid, amfreqs[0], ammags[c].T).T
+		fmrows = frameresample(fmgrid, fmfreqs[0], fmmags[c].T).T
+		frames = np.column_stack((
+			frameresample(times, envtimes, envelope[c]),
+			frameresample(times, f0times, f0array[c]),
+			frameresample(times, amtimes, amrows),
+			frameresample(times, fmtimes, fmrows) ))
+		items += [ (rowname, frames.astype(np.float32)) ]
+
+	return items
+
+#===============================================================
+# Tensor and index files
+
+def frametensoropen(tensorfilename, itemframes, columns):
+
+	"""Allocates the tensor; returns it and the offset of each item."""
+
+	offsets = np.concatenate(([0], np.cumsum(itemframes)[:-1])).astype(np.int64)
+	tensor = np.lib.format.open_memmap(tensorfilename, mode="w+",
+		dtype=np.float32, shape=(int(np.sum(itemframes)), len(columns)))
+
+	return tensor, offsets
+
+def frameindexwrite(tensorfilename, itemnames, offsets, itemframes, columns, framerate):
+
+	"""Index (failed items: 0 frames), frame rate and column names."""
+
+	index = np.zeros(len(itemnames), dtype=[
+		("name", "U%d"%max([ len(name) for name in itemnames ] + [1])),
+		("offset", np.int64), ("frames", np.int64) ])
+	index["name"] = itemnames
+	index["offset"] = offsets
+	index["frames"] = itemframes
+	np.save(re.sub(r"\.npy$", "", tensorfilename) + "_index.npy", index)
+
+	with open(re.sub(r"\.npy$", "", tensorfilename) + ".json", "w") as handle:
+		json.dump({ "framerate": framerate, "columns": columns }, handle, indent=1)
+
+	return
+
+def frametensorread(tensorfilename):
+
+	"""Returns the memory-mapped tensor, the index, frame rate and columns."""
+
+	tensor = np.load(tensorfilename, mmap_mode="r")
+	index = np.load(re.sub(r"\.npy$", "", tensorfilename) + "_index.npy")
+	with open(re.sub(r"\.npy$", "", tensorfilename) + ".json") as handle:
+		header = json.load(handle)
+
+	return tensor, index, header["framerate"], header["columns"]
+
+#===============================================================
+# EOF
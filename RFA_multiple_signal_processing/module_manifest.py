@@ -0,0 +1,99 @@
+# module_manifest.py
+# D. Gibbon
+# Created 2022-07-20
+# Incremental processing manifest module for rfa_mult.py
+
+"""
+Manifest for incremental, resumable, fault-isolated runs
+
+- Each WAV file is identified by a hash of its content; the hash is
+  only recomputed when the file size or modification time changes.
+- Items of a packed corpus (see rfa_pack.py) are hashed by their
+  sample data; their hashes are recomputed when the corpus changes.
+- The analysis configuration (see module_analysis.py) is hashed too.
+- The features of each analysed file are cached in the cache directory
+  under a key made of file name, content hash and configuration hash,
+  so a file is only analysed again if one of these changes.
+- Failures are recorded per file with the error message, and the
+  batch continues; failed files are retried when they change,
+  or on request.
+- The manifest is written atomically (temporary file and rename),
+  so an interrupted run leaves a valid manifest and resumes from the
+  cache: everything finished before the interruption is reused.
+"""
+
+#===============================================================
+
+import os, re, json, hashlib
+import numpy as np
+
+from module_audio import packsplit, packitem
+
+#===============================================================
+# Hashes
+
+def contenthash(filename, blocksize=2**20):
+
+	h = hashlib.sha1()
+	packed = packsplit(filename)
+	if packed is not None:
+		fs, signal = packitem(*packed)
+		h.update(("%d %s %s"%(fs, signal.dtype.str, signal.shape)).encode("utf8"))
+		h.update(np.ascontiguousarray(signal).view(np.uint8))
+		return h.hexdigest()
+
+	with open(filename, "rb") as handle:
+		for block in iter(lambda: handle.read(blocksize), b""):
+			h.update(block)
+
+	return h.hexdigest()
+
+def confighash(config):
+
+	text = json.dumps(config, sort_keys=True, default=repr)
+
+	return hashlib.sha1(text.encode("utf8")).hexdigest()
+
+#===============================================================
+# Manifest input and atomic output
+
+def manifestread(manifestfilename):
+
+	if not os.path.exists(manifestfilename): return {}
+	with open(manifestfilename) as handle:
+		return json.load(handle)
+
+def manifestwrite(manifest, manifestfilename):
+
+	tmpfilename = manifestfilename + ".tmp"
+	with open(tmpfilename, "w") as handle:
+		json.dump(manifest, handle, indent=1, sort_keys=True)
+		handle.flush()
+		os.fsync(handle.fileno())
+	os.replace(tmpfilename, manifestfilename)
+
+	return
+
+#===============================================================
+# Manifest entry of one file, content hash reused if size and time agree
+
+def manifestentry(manifest, wavfilename):
+
+	packed = packsplit(wavfilename)
+	stat = os.stat(wavfilename if packed is None else packed[0])
+	entry = manifest.get(wavfilename, {})
+	if entry.get("size") != stat.st_size or entry.get("mtime") != stat.st_mtime_ns:
+		entry = { "size": stat.st_size, "mtime": stat.st_mtime_ns,
+			"hash": contenthash(wavfilename) }
+	manifest[wavfilename] = entry
+
+	return entry
+
+def cachefilename(cachedirectory, wavfilename, filehash, confighash):
+
+	wavfilebase = re.sub("[^A-Za-z0-9_.-]", "_", re.sub(".*/", "", wavfilename))
+
+	return "%s/%s-%s-%s.npz"%(cachedirectory, wavfilebase, filehash[:16], confighash[:16])
+
+#===============================================================
+# EOF
@@ -0,0 +1,243 @@
+# module_network.py
+# D. Gibbon
+# Created 2022-07-20
+# Distance network module for numdistnetdendro.py
+
+"""
+Graphviz distance networks, with layout decoupled from analysis
+
+- With gvdeferred (numdistnetdendro_conf.py), distnetworks only writes
+  the Graphviz source (.gv); a source file is rewritten only if its
+  text has changed.
+- gvrender then lays out and renders all sources as concurrent 'dot'
+  subprocesses. A graph whose PNG is newer than its source was
+  rendered from the same source before, and is skipped.
+- Edges are selected by vectorised masks over blocks of the condensed
+  distance matrix (networkmode "range": normalised distance within
+  [mindistance, maxdistance]), or as the networkneighbours nearest
+  neighbours of each node, symmetrised in a sparse matrix ("knn");
+  with networkedgemax > 0, at most that many edges, the shortest, are
+  kept (default 0: all edges). The DOT text of the edges is added in
+  bulk, as d.node and d.edge would write it.
+- Networks with more than gvsfdpedges edges get the layout attribute
+  sfdp (scalable force-directed layout) in their source; dot reads
+  the attribute, and a change of engine is a change of source.
+- Without gvdeferred, each network is rendered at once, as before.
+"""
+
+#===============================================================
+
+import os, time, subprocess
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+import scipy.sparse as sparse
+
+from module_distance import condensedstart, distanceblocks
+
+from numdistnetdendro_conf import *
+
+#===============================================================
+# Edge selection, vectorised, on the condensed matrix in row blocks;
+# edges are (i, j, normalised distance) with i < j, in row order, and
+# the number of edges before the edgemax limit
+
+def networkshortest(rows, cols, values, edgemax):
+
+	"""The edgemax shortest edges (all if edgemax is 0), in row order."""
+
+	if edgemax <= 0 or len(values) <= edgemax: return rows, cols, values
+	keep = np.sort(np.argsort(values, kind="stable")[:edgemax])
+
+	return rows[keep], cols[keep], values[keep]
+
+def networkrange(distances, n, normalise, mindistance, maxdistance, edgemax=0):
+
+	"""Edges with normalised distance in [mindistance, maxdistance] (upper triangle masks)."""
+
+	rows, cols, values = [], [], []
+	kept, total = 0, 0
+	for a, b in distanceblocks(n, networkblockbytes, 3):
+		block = normalise(distances[condensedstart(n, a):condensedstart(n, b)])
+		k = np.flatnonzero((block >= mindistance) & (block <= maxdistance))
+		# Condensed position -> row i and column j
+		starts = condensedstart(n, np.arange(a, b)) - condensedstart(n, a)
+		i = np.searchsorted(starts, k, side="right") - 1
+		rows += [ a + i ]
+		cols += [ a + i + 1 + k - starts[i] ]
+		values += [ block[k] ]
+		kept += len(k)
+		total += len(k)
+		if edgemax > 0 and kept > 4 * edgemax:
+			rows, cols, values = [ [ x ] for x in networkshortest(
+				np.concatenate(rows), np.concatenate(cols), np.concatenate(values), edgemax) ]
+			kept = edgemax
+
+	if len(rows) == 0: return np.zeros(0, int), np.zeros(0, int), np.zeros(0), 0
+
+	return networkshortest(np.concatenate(rows), np.concatenate(cols), np.concatenate(values), edgemax) + (total,)
+
+def networkknn(distances, n, normalise, neighbours, edgemax=0):
+
+	"""Edges to the nearest neighbours of each node (either way), via a sparse matrix."""
+
+	if n < 2: return np.zeros(0, int), np.zeros(0, int), np.zeros(0), 0
+	neighbours = max(1, min(neighbours, n-1))
+
+	# Row blocks, the last one including the last row
+	blocks = distanceblocks(n, networkblockbytes, 4)
+	blocks[-1] = (blocks[-1][0], n)
+
+	rows, cols, values = [], [], []
+	for a, b in blocks:
+		# Full rows a..b-1 of the distance matrix, gathered from the condensed form
+		i, j = np.arange(a, b)[:, np.newaxis], np.arange(n)[np.newaxis, :]
+		lower, upper = np.minimum(i, j), np.maximum(i, j)
+		position = np.where(upper > lower, condensedstart(n, lower) + upper - lower - 1, 0)
+		block = normalise(distances[position.ravel()]).reshape(position.shape)
+		block[upper == lower] = np.inf
+		nearest = np.argpartition(block, neighbours-1, axis=1)[:, :neighbours]
+		rows += [ np.repeat(np.arange(a, b), neighbours) ]
+		cols += [ nearest.ravel() ]
+		values += [ np.take_along_axis(block, nearest, axis=1).ravel() ]
+
+	# Symmetric sparse k-NN matrix; distances + 1, so that zero distances are kept
+	knn = sparse.coo_matrix((np.concatenate(values) + 1, (np.concatenate(rows), np.concatenate(cols))),
+		shape=(n, n)).tocsr()
+	knn = sparse.triu(knn.maximum(knn.T), k=1).tocoo()
+	order = np.lexsort((knn.col, knn.row))
+
+	return networkshortest(knn.row[order], knn.col[order], knn.data[order] - 1, edgemax) + (knn.nnz,)
+
+#===============================================================
+# Graphviz network representation
+
+def distnetworks(names, data, distances, netname, distmetric, mindistance, maxdistance):
+
+	"""Returns the PNG file name, or with gvdeferred the .gv source file name."""
+
+	from graphviz import Graph
+	try:
+		from graphviz.quoting import quote
+	except ImportError:
+		from graphviz.lang import quote		# graphviz < 0.18
+
+	filename = netname + "-gv-" + distmetric
+
+	# Select: dot, neato, fdp, twopi und circo
+
+	d = Graph('D', filename=filename, engine='dot', format='png')
+	d.attr('node', shape='ellipse', fontsize='12', size='6,6', rankdir='LR')
+
+	# Normalisation as over the square form (zero diagonal included),
+	# block by block: the square form is never created
+	n = len(names)
+	mindist = min(0.0, float(np.min(distances)))
+	maxdist = max(0.0, float(np.max(distances)))
+
+	def normalise(dist_list):
+		return (np.asarray(dist_list, dtype=np.float64) - mindist) / (maxdist - mindist)
+
+	ncount = n * n
+
+	if networkmode == "knn":
+		rows, cols, values, total = networkknn(distances, n, normalise, networkneighbours, networkedgemax)
+		selection = 'k=%d nearest neighbours'%networkneighbours
+	else:
+		rows, cols, values, total = networkrange(distances, n, normalise, mindistance, maxdistance, networkedgemax)
+		selection = '%s min %s max'%(mindistance, maxdistance)
+	count = len(values)
+	if count < total:
+		selection += ', shortest %d of %d'%(count, total)
+
+	# DOT text in bulk: both nodes and the edge, as d.node and d.edge would write them
+	# (body lines end with a newline from graphviz 0.18, else they are joined by one)
+	end = "\n" if d.body[-1].endswith("\n") else ""
+	quoted = [ quote(name) for name in names ]
+	d.body += [ "\t%s\n\t%s\n\t%s -- %s [label=%.3f]%s"%(
+		quoted[i], quoted[j], quoted[i], quoted[j], distance, end)
+		for i, j, distance in zip(rows.tolist(), cols.tolist(), values.tolist()) ]
+
+	d.node(netname +"\n" + distmetric + ' distance metric\nn=%d/%d, %s'%(count,ncount,selection), shape='box')
+
+	# Large graphs: scalable force-directed layout
+	if gvsfdpedges > 0 and count > gvsfdpedges:
+		d.attr(layout='sfdp')
+
+	if gvdeferred:
+		return gvsave(filename + ".gv", d.source)
+
+	d.render(filename, view=False, format="png")
+
+	return filename + ".png"
+
+#===============================================================
+# Deferred rendering of .gv sources
+
+def gvsave(gvfilename, source):
+
+	"""Writes the source only if it has changed, so that its PNG stays valid."""
+
+	if os.path.exists(gvfilename):
+		with open(gvfilename, encoding="utf8") as handle:
+			if handle.read() == source: return gvfilename
+	with open(gvfilename, "w", encoding="utf8") as handle:
+		handle.write(source)
+
+	return gvfilename
+
+def gvrenderone(gvfilename):
+
+	"""Returns the PNG file name and whether it was rendered (not skipped)."""
+
+	pngfilename = gvfilename[:-len(".gv")] + ".png"
+	if os.path.exists(pngfilename) and os.stat(pngfilename).st_mtime_ns >= os.stat(gvfilename).st_mtime_ns:
+		return pngfilename, False
+
+	tmpfilename = "%s.tmp%d.png"%(gvfilename[:-len(".gv")], os.getpid())
+	try:
+		subprocess.run([ gvengine, "-Tpng", "-o", tmpfilename, gvfilename ],
+			check=True, capture_output=True)
+		os.replace(tmpfilename, pngfilename)
+	finally:
+		if os.path.exists(tmpfilename): os.remove(tmpfilename)
+
+	return pngfilename, True
+
+def gvrender(gvfilenames, jobs=0):
+
+	"""
+Renders the sources in jobs concurrent layout processes (0: one per CPU).
+Returns { gvfilename: (pngfilename, seconds, error) }; error is None
+or the exception (e.g. layout program missing or failed).
+	"""
+
+	if jobs < 1: jobs = os.cpu_count() or 1
+
+	def rendertimed(gvfilename):
+		start = time.time()
+		pngfilename, rendered = gvrenderone(gvfilename)
+		return pngfilename, time.time() - start, rendered
+
+	results = {}
+	renderedcount = 0
+	with ThreadPoolExecutor(max(1, jobs)) as pool:
+		futures = { gvfilename: pool.submit(rendertimed, gvfilename) for gvfilename in gvfilenames }
+		for gvfilename, future in futures.items():
+			try:
+				pngfilename, seconds, rendered = future.result()
+				results[gvfilename] = (pngfilename, seconds, None)
+				renderedcount += rendered
+			except Exception as rendererror:
+				if isinstance(rendererror, subprocess.CalledProcessError):
+					rendererror = RuntimeError(rendererror.stderr.decode("utf8", "replace").strip())
+				results[gvfilename] = (gvfilename[:-len(".gv")] + ".png", 0.0, rendererror)
+				print("Error:", gvfilename, "%s: %s"%(type(rendererror).__name__, rendererror))
+	print("Networks: %d rendered, %d unchanged, %d errors"%(renderedcount,
+		len([ r for r in results.values() if r[2] is None ]) - renderedcount,
+		len([ r for r in results.values() if r[2] is not None ])))
+
+	return results
+
+#===============================================================
+# EOF
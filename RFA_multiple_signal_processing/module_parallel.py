@@ -0,0 +1,131 @@
+# module_parallel.py
+# D. Gibbon
+# Created 2022-07-20
+# Process pool module for rfa_mult.py
+
+"""
+Parallel analysis of independent files in a process pool
+
+- Each worker process analyses one file at a time; files are
+  submitted in schedule order (see module_schedule.py).
+- BLAS and FFT threads are limited in each worker (default 1), so
+  that workers x threads does not exceed the CPU count. The thread
+  pools of OpenBLAS, MKL and OpenMP are sized when numpy is loaded, so
+  threadpreset sets their environment variables in the main process
+  before numpy is imported; the workers inherit them when forked.
+  threadpoolctl, if it is installed, also limits the pools in each
+  worker; without it, a warning is given if numpy was loaded first.
+- Results are collected in the main process as they arrive; the
+  caller puts them into a deterministic (sorted) order.
+- Worker processes are forked: rfa_mult.py is a script, and would be
+  run again by the 'spawn' start method. Where fork is not available,
+  the files are analysed in the main process.
+- If a worker dies (e.g. killed when out of memory), the pool breaks
+  and all its pending items fail with BrokenProcessPool. These items
+  are not failures of their own: they are submitted again to a new
+  pool with half as many workers (less memory). In a pool of one
+  worker, the item that was running when the worker died is the one
+  which fails.
+"""
+
+#===============================================================
+
+import os, sys, time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, BrokenExecutor, as_completed
+
+try:
+	from threadpoolctl import threadpool_limits	# optional
+except ImportError:
+	threadpool_limits = None
+
+#===============================================================
+# Thread limits in a worker process
+
+threadvariables = [
+	"OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+	"BLIS_NUM_THREADS", "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS" ]
+
+def threadpreset(jobs, threads):
+
+	"""In the main process, before numpy is imported: limits for the workers, if jobs > 1."""
+
+	if jobs > 1:
+		for variable in threadvariables:
+			os.environ.setdefault(variable, str(threads))
+
+	return
+
+def threadlimit(threads):
+
+	if threadpool_limits is not None:
+		threadpool_limits(threads)
+	elif "numpy" in sys.modules and any([ os.environ.get(variable) != str(threads)
+		for variable in threadvariables[:3] ]):
+		print("Warning: BLAS threads not limited to %d: install threadpoolctl, or call threadpreset before importing numpy."%threads)
+
+	return
+
+#===============================================================
+# Timed call in a worker: result and analysis time in seconds
+
+def timedcall(function, item):
+
+	start = time.time()
+	result = function(item)
+
+	return result, time.time() - start
+
+#===============================================================
+
+def parallelrun(items, processitem, collectitem, workers, initializer=None, initargs=()):
+
+	"""
+processitem(item) -> result, in a worker process
+collectitem(item, (result, seconds), error), in the calling process,
+	in order of completion; error is the worker's exception or None
+	"""
+
+	if "fork" not in multiprocessing.get_all_start_methods():
+		for item in items:
+			try:
+				timedresult, error = timedcall(processitem, item), None
+			except Exception as processerror:
+				timedresult, error = None, processerror
+			collectitem(item, timedresult, error)
+		return
+
+	context = multiprocessing.get_context("fork")
+	pending = list(items)
+	poolworkers = workers
+
+	while len(pending) > 0:
+		broken = []
+		with ProcessPoolExecutor(poolworkers, mp_context=context,
+			initializer=initializer, initargs=initargs) as pool:
+			futures = { pool.submit(timedcall, processitem, item): k for k, item in enumerate(pending) }
+			for future in as_completed(futures):
+				try:
+					timedresult, error = future.result(), None
+				except BrokenExecutor:
+					broken += [ futures[future] ]	# a worker died: not this item's failure
+					continue
+				except Exception as processerror:
+					timedresult, error = None, processerror
+				collectitem(pending[futures[future]], timedresult, error)
+
+		if len(broken) == 0: break
+		broken.sort()
+
+		if poolworkers == 1:
+			# One worker, items in order: the first unfinished item stopped it
+			collectitem(pending[broken[0]], None, RuntimeError("worker process died during this item"))
+			broken = broken[1:]
+		poolworkers = max(1, poolworkers // 2)
+		print("Worker process died; submitted again: %d items, %d workers"%(len(broken), poolworkers))
+		pending = [ pending[k] for k in broken ]
+
+	return
+
+#===============================================================
+# EOF
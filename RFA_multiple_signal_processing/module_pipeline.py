@@ -0,0 +1,86 @@
+# module_pipeline.py
+# D. Gibbon
+# Created 2022-07-20
+# Prefetching I/O pipeline module for rfa_mult.py
+
+"""
+Three stage pipeline: read, analyse, write
+
+	reader thread	reads and decodes the next files
+	caller		analyses one file after the other
+	writer thread	writes the outputs of finished files
+The stages are connected by bounded queues, so at most depth files
+are read ahead and at most depth outputs wait to be written: reading,
+analysis and writing overlap, and memory stays bounded.
+NumPy, SciPy and file I/O release the GIL for large operations, so
+the threads run concurrently with the analysis.
+A read error is passed on with the item, so that the analysis stage
+can record it as a failure of that item and continue.
+With depth 0, the three stages simply run one after the other.
+"""
+
+#===============================================================
+
+import threading, queue
+
+#===============================================================
+
+def pipelinerun(items, readitem, processitem, writeitem, depth=2):
+
+	"""
+readitem(item) -> data
+processitem(item, data, error) -> result (error: read exception or None)
+writeitem(item, result)
+	"""
+
+	if depth <= 0:
+		for item in items:
+			try:
+				data, error = readitem(item), None
+			except Exception as readerror:
+				data, error = None, readerror
+			writeitem(item, processitem(item, data, error))
+		return
+
+	readqueue = queue.Queue(maxsize=depth)
+	writequeue = queue.Queue(maxsize=depth)
+
+	def reader():
+		for item in items:
+			try:
+				data, error = readitem(item), None
+			except Exception as readerror:
+				data, error = None, readerror
+			readqueue.put((item, data, error))
+		readqueue.put(None)
+
+	def writer():
+		while True:
+			job = writequeue.get()
+			if job is None: break
+			try:
+				writeitem(*job)
+			except Exception as writeerror:
+				print("Write error:", job[0], writeerror)
+
+	readerthread = threading.Thread(target=reader, daemon=True)
+	writerthread = threading.Thread(target=writer, daemon=True)
+	readerthread.start()
+	writerthread.start()
+
+	while True:
+		job = readqueue.get()
+		if job is None: break
+		item, data, error = job
+		result = processitem(item, data, error)
+		del data, job	# release the input before waiting for the next one
+		writequeue.put((item, result))
+
+	writequeue.put(None)
+	writerthread.join()
+	readerthread.join()
+
+	return
+
+#===============================================================
+# EOF
@@ -0,0 +1,158 @@
+# module_schedule.py
+# D. Gibbon
+# Created 2022-07-20
+# Batch scheduling module for rfa_mult.py
+
+"""
+Duration-aware, memory-aware batch scheduling
+
+- Durations are taken from the WAV headers only (or from the index of
+  a packed corpus); no sample data are read.
+- Files are processed longest first, so that no long file is left
+  for the end of the run when the other workers are idle.
+- The worker count is limited by the RAM which the longest file needs
+  (RAM per audio minute), within the available RAM.
+- The wall-clock time is predicted by assigning files, longest first,
+  to the least busy worker, at a processing rate (seconds per audio
+  minute) measured in earlier runs, or a default rate.
+"""
+
+#===============================================================
+
+import os, struct, heapq
+
+from module_audio import wavread, packsplit, packitem
+
+#===============================================================
+# Duration from the WAV header: RIFF chunks up to the data chunk
+
+def wavheader(wavfilename):
+
+	"""
+Returns fs, channel count and length in samples, or None if the
+header is not a plain RIFF WAV header.
+	"""
+
+	with open(wavfilename, "rb") as handle:
+		riff = handle.read(12)
+		if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE": return None
+		fs = channels = blockalign = None
+		while True:
+			chunk = handle.read(8)
+			if len(chunk) < 8: return None
+			chunkid, chunksize = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+			if chunkid == b"fmt ":
+				fmt = handle.read(chunksize + chunksize % 2)
+				channels, fs = struct.unpack("<HI", fmt[2:8])
+				blockalign = struct.unpack("<H", fmt[12:14])[0]
+			elif chunkid == b"data":
+				if blockalign is None or blockalign == 0: return None
+				filesize = os.fstat(handle.fileno()).st_size
+				datasize = min(chunksize, filesize - handle.tell())
+				return fs, channels, datasize // blockalign
+			else:
+				handle.seek(chunksize + chunksize % 2, 1)
+
+def wavduration(wavfilename):
+
+	packed = packsplit(wavfilename)
+	header = None if packed is not None else wavheader(wavfilename)
+	if header is not None:
+		fs, channels, length = header
+	else:
+		# Packed item or other header types: lazy (memory-mapped) read
+		fs, signal = packitem(*packed) if packed is not None else wavread(wavfilename)
+		channels = 1 if signal.ndim == 1 else signal.shape[1]
+		length = signal.shape[0]
+
+	return length / fs, channels
+
+#===============================================================
+# Longest first
+
+def scheduleorder(wavfilelist):
+
+	"""
+Returns the files, longest first (name order for equal durations),
+and their durations in seconds multiplied by their channel counts.
+	"""
+
+	durations = {}
+	for wavfilename in wavfilelist:
+		try:
+			seconds, channels = wavduration(wavfilename)
+		except Exception:
+			seconds, channels = 0, 1	# unreadable: the analysis records the error
+		durations[wavfilename] = seconds * channels
+
+	order = sorted(wavfilelist, key=lambda name: (-durations[name], name))
+
+	return order, durations
+
+def schedulechannels(wavfilelist):
+
+	"""Largest channel count of the files (1 for none, or unreadable ones)."""
+
+	channelcounts = [ 1 ]
+	for wavfilename in wavfilelist:
+		try:
+			channelcounts += [ wavduration(wavfilename)[1] ]
+		except Exception:
+			pass
+
+	return max(channelcounts)
+
+#===============================================================
+# Worker count from available RAM
+
+def availableram():
+
+	"""Available RAM in MB (Linux /proc/meminfo, otherwise physical RAM)."""
+
+	try:
+		with open("/proc/meminfo") as handle:
+			for line in handle:
+				if line.startswith("MemAvailable:"):
+					return int(line.split()[1]) / 1024
+	except OSError:
+		pass
+
+	return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 2**20
+
+def scheduleworkers(durations, jobs, ramperminute, rambudget=0):
+
+	"""
+At most jobs workers, and at most as many as fit into the RAM budget
+(MB; 0: available RAM) if each holds the longest file.
+	"""
+
+	if rambudget <= 0: rambudget = availableram()
+	longest = max(list(durations.values()) + [0]) / 60
+	perworker = max(1.0, ramperminute * longest)
+
+	return max(1, min(jobs, int(rambudget // perworker)))
+
+#===============================================================
+# Predicted wall-clock time, longest processing time first
+
+def scheduletime(order, durations, workers, secondsperminute):
+
+	loads = [ 0.0 ] * workers
+	for wavfilename in order:
+		load = heapq.heappop(loads)
+		heapq.heappush(loads, load + durations[wavfilename] / 60 * secondsperminute)
+
+	return max(loads)
+
+def schedulerate(manifest, defaultrate):
+
+	"""Seconds per audio minute measured in earlier runs (see module_manifest.py)."""
+
+	seconds = sum([ entry["seconds"] for entry in manifest.values() if "seconds" in entry ])
+	minutes = sum([ entry["minutes"] for entry in manifest.values() if "seconds" in entry ])
+	if minutes <= 0: return defaultrate
+
+	return seconds / minutes
+
+#===============================================================
+# EOF
@@ -0,0 +1,191 @@
+# module_shard.py
+# D. Gibbon
+# Created 2022-07-20
+# Multi-host sharding module for rfa_mult.py
+
+"""
+Sharded batch processing over a shared file system (e.g. NFS)
+
+Several hosts run rfa_mult.py with the same shared work directory:
+	units.json		the file list, split into work units, with its
+				hash; written once, by the first host, so all
+				hosts agree
+	unit-NNNNN.claim-G	a host is working on unit NNNNN (generation G)
+	unit-NNNNN.npz		partial feature store of unit NNNNN (done)
+	merge.claim-G		a host is merging (or has merged) the partial stores
+- A host whose file list differs from the one in units.json (e.g. the
+  corpus has grown) refuses to work in the directory: a new directory
+  is needed, or the old one has to be removed.
+- A unit is claimed by exclusive creation of its claim file, which
+  only one host can succeed in (O_CREAT | O_EXCL).
+- The claiming host refreshes the claim's modification time after
+  each file, whether analysed, failed or taken from the cache; a
+  claim older than the expiry time is stale (crashed host), so the
+  expiry time has to be longer than the analysis of the longest file.
+  A stale claim is taken over by exclusive creation of the claim of the
+  next generation, which again only one host can succeed in; claims
+  are never renamed or removed while a unit is open.
+- Partial stores are written under a temporary name and renamed.
+- Hosts keep taking over units until all are done, waiting while
+  other hosts hold them. Then one host claims the merge, merges the
+  partial stores in unit order, which is the canonical (sorted) file
+  order, and writes the feature store and CSV files.
+"""
+
+#===============================================================
+
+import os, re, json, time, socket, hashlib
+
+from module_features import featurestoreread, featureextend
+
+#===============================================================
+# Work units: agreed by all hosts through units.json
+
+def shardunits(sharddirectory, wavfilelist, unitsize):
+
+	"""Returns the work units, or None if units.json is for another file list."""
+
+	os.makedirs(sharddirectory, exist_ok=True)
+	unitsfilename = sharddirectory + "/units.json"
+
+	units = [ wavfilelist[k:k+unitsize] for k in range(0, len(wavfilelist), unitsize) ]
+	unitshash = hashlib.sha1(json.dumps(units).encode("utf8")).hexdigest()
+
+	if not os.path.exists(unitsfilename):
+		tmpfilename = "%s.tmp-%s-%d"%(unitsfilename, socket.gethostname(), os.getpid())
+		with open(tmpfilename, "w") as handle:
+			json.dump({ "hash": unitshash, "units": units }, handle, indent=1)
+		try:
+			os.link(tmpfilename, unitsfilename)	# fails if another host was first
+		except FileExistsError:
+			pass
+		os.remove(tmpfilename)
+
+	with open(unitsfilename) as handle:
+		shared = json.load(handle)
+
+	if not isinstance(shared, dict) or shared.get("hash") != unitshash:
+		return None
+
+	return shared["units"]
+
+def shardfilename(sharddirectory, unit, extension):
+
+	return "%s/unit-%05d.%s"%(sharddirectory, unit, extension)
+
+def shardopen(sharddirectory, unitcount):
+
+	"""Number of units not yet done."""
+
+	return len([ unit for unit in range(unitcount)
+		if not os.path.exists(shardfilename(sharddirectory, unit, "npz")) ])
+
+#===============================================================
+# Claims: <name>.claim-G, the highest generation G is the current one
+
+def shardclaims(claimstem):
+
+	directory, base = os.path.split(claimstem)
+	generations = [ (int(name[len(base)+1:]), directory + "/" + name)
+		for name in os.listdir(directory or ".")
+		if re.fullmatch(re.escape(base) + "-[0-9]+", name) ]
+
+	return sorted(generations)
+
+def shardlock(claimstem, expiry):
+
+	"""Returns the claim file name if this host now holds the lock, else None."""
+
+	claims = shardclaims(claimstem)
+	if len(claims) == 0:
+		generation = 0
+	else:
+		# Existing claim: taken over if stale, by the next generation
+		try:
+			if time.time() - os.stat(claims[-1][1]).st_mtime < expiry: return None
+		except FileNotFoundError:
+			return None	# released
+		generation = claims[-1][0] + 1
+
+	claimfilename = "%s-%d"%(claimstem, generation)
+	host = "%s-%d"%(socket.gethostname(), os.getpid())
+	try:
+		handle = os.open(claimfilename, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+	except FileExistsError:
+		return None	# another host was first
+	os.write(handle, ("%s %s\n"%(host, time.ctime())).encode("utf8"))
+	os.close(handle)
+	if generation > 0:
+		print("Taking over stale claim:", claims[-1][1])
+
+	return claimfilename
+
+def shardunlock(claimstem):
+
+	for generation, claimfilename in shardclaims(claimstem):
+		try:
+			os.remove(claimfilename)
+		except FileNotFoundError:
+			pass
+
+	return
+
+def shardclaim(sharddirectory, unit, expiry):
+
+	"""Returns the claim file name if this host now holds the unit, else None."""
+
+	unitstore = shardfilename(sharddirectory, unit, "npz")
+	if os.path.exists(unitstore): return None
+
+	claimfilename = shardlock(shardfilename(sharddirectory, unit, "claim"), expiry)
+
+	# Done by another host between the check and the claim
+	if claimfilename is not None and os.path.exists(unitstore):
+		os.remove(claimfilename)
+		return None
+
+	return claimfilename
+
+def shardtouch(claimfilename):
+
+	try:
+		os.utime(claimfilename)
+	except FileNotFoundError:
+		pass
+
+	return
+
+def sharddone(sharddirectory, unit, claimfilename):
+
+	"""Releases all claims of the unit, after its partial store is written."""
+
+	shardunlock(shardfilename(sharddirectory, unit, "claim"))
+
+	return
+
+def shardmergeclaim(sharddirectory, expiry):
+
+	"""The merge claim is kept: the merge is done once, or again after expiry."""
+
+	return shardlock(sharddirectory + "/merge.claim", expiry)
+
+#===============================================================
+# Merge of the partial stores in unit order
+
+def shardmerge(sharddirectory, unitcount):
+
+	"""Returns the merged features, or None while units are still open."""
+
+	opencount = shardopen(sharddirectory, unitcount)
+	if opencount > 0:
+		print("Units not yet done: %d of %d"%(opencount, unitcount))
+		return None
+
+	features = {}
+	for unit in range(unitcount):
+		featureextend(features, featurestoreread(shardfilename(sharddirectory, unit, "npz")))
+
+	return features
+
+#===============================================================
+# EOF
@@ -7,42 +7,67 @@
 #===============================================================
 
 import numpy as np
+from module_peaks import spectralpeaks
 
 #===============================================================
 
-def spectrogramarray(signal, fs, specfreqmin, specfreqmax, specdownsample, spectrumpower, specwindowsecs, specstrides):
+def spectrogramwindows(signallen, fs, specdownsample, specwindowsecs, specstrides):
 
 	# Brute force downsampling, optional
-	signal = signal[::specdownsample]
+	signallen = len(range(0, signallen, specdownsample))
 	fs = int(round(fs/specdownsample))
-	period = 1/fs
-	signallen = len(signal)
-	signalsecs = int(round(signallen / fs))
 
 	#============================================
 	windowlen = int(round(specwindowsecs * fs))	# window length sec -> sample
 	signalleneffective = signallen - windowlen	# first to last stride pos
 	stride = int(round(signalleneffective / specstrides))	# time step
 
+	# Stride start counters
+	counterstart = np.array(range(0,signalleneffective,stride))
+
+	return fs, windowlen, counterstart
+
+#===============================================================
+
+def spectrogramarray(signal, fs, specfreqmin, specfreqmax, specdownsample, spectrumpower, specwindowsecs, specstrides):
+
+	# A (channels, samples) signal gives (channels, spectra, freqs) magnitudes
+	# and (channels, spectra) trajectories; all channels in each FFT call
+
+	signal = np.asarray(signal)
+
+	# Brute force downsampling, optional
+	dsfs, windowlen, counterstart = spectrogramwindows(
+		signal.shape[-1], fs, specdownsample, specwindowsecs, specstrides)
+	signal = signal[..., ::specdownsample]
+	fs = dsfs
+	period = 1/fs
+
 	# Moving window
 	
 	# Stride start and end counters
-	counterstart = np.array(range(0,signalleneffective,stride))	# start & end
 	counterend = counterstart + windowlen
 
 	magarray = []
 	freqarray = []
 	for countstart,countend in zip(counterstart,counterend):
-		segment = np.abs(signal[countstart:countend])				# window-length segment
-		segment = list(segment)
-		segment = segment
-		segment = np.array(segment)
-		mags = abs(np.fft.rfft(segment))						# FFT magnitudes
-		freqs = np.abs(np.fft.rfftfreq(segment.size,period))	# FFT frequencies
+		segment = np.abs(signal[..., countstart:countend])		# window-length segment
+		mags = abs(np.fft.rfft(segment, axis=-1))				# FFT magnitudes
+		freqs = np.abs(np.fft.rfftfreq(segment.shape[-1],period))	# FFT frequencies
 #		freqs = np.linspace(0, fs/2, len(mags))
 		magarray += [ mags ]								# collect FFTs
 		freqarray += [ freqs ]
 
+	if signal.ndim > 1:
+		magarray = np.stack(magarray, axis=-2)	# (channels, spectra, freqs)
+
+	return spectrogramrows(
+		magarray, freqarray, fs, specfreqmin, specfreqmax, spectrumpower)
+
+#===============================================================
+
+def spectrogramrows(magarray, freqarray, fs, specfreqmin, specfreqmax, spectrumpower):
+
 	#============================================
 	# Spectrum properties
 
@@ -55,30 +80,80 @@ def spectrogramarray(signal, fs, specfreqmin, specfreqmax, specdownsample, spect
 	xmax = specfreqmax * elementsperhertz
 	sfmin = int(np.floor(xmin))
 	sfmax = int(np.ceil(xmax))
-	magarray = np.array([ x[sfmin:sfmax] for x in magarray ])**spectrumpower
-	freqarray = [ x[sfmin:sfmax] for x in freqarray ]
+	magarray = np.asarray(magarray)[..., sfmin:sfmax]**spectrumpower
+	freqarray = np.array([ x[sfmin:sfmax] for x in freqarray ])
 
 	#Detect maximum vector through spectrogram
-	maxmags = np.array([ max(mags[1:]) for mags in magarray ])
-#	print(maxmags.shape)
-
-	#============================================
-	# Loop to define spectrogram as a spectrum sequence
-	maxfreqs = []
-	for mags, freqs in zip(magarray, freqarray):
-		maxofmags = np.max(mags)
-		# An error with a very deep voice (60Hz) threw an error
-		if maxofmags == 0.0: maxofmags = 0.0001	# a hack, sorry
-		mags = mags/maxofmags
-		mags = list(mags[1:])
-		maxmag = np.max(mags)
-		maxmagpos = mags.index(maxmag)
-		maxfreq = freqs[maxmagpos]
-		maxmags += [maxmag]
-		maxfreqs += [maxfreq]
+	# All rows (of all channels) are scaled to 0...1
+	# and searched for their peak in one call
+	maxofmags = np.max(magarray, axis=-1, keepdims=True)
+	# An error with a very deep voice (60Hz) threw an error
+	maxofmags[maxofmags == 0.0] = 0.0001	# a hack, sorry
+	rows = magarray[..., 1:] / maxofmags
+	rowfreqs = np.broadcast_to(freqarray[:, 1:], rows.shape)
+	maxmags, maxfreqs, maxmagpos = spectralpeaks(
+		rows.reshape(-1, rows.shape[-1]), rowfreqs.reshape(-1, rows.shape[-1]), 1)
+	maxmags = maxmags.reshape(rows.shape[:-1])
+	maxfreqs = maxfreqs.reshape(rows.shape[:-1])
 
 	return np.array(magarray), np.array(freqarray), maxmags, maxfreqs
 
+#===============================================================
+# Block-wise (streamed) spectrogram window extraction
+# Blocks of the signal are passed in order; the downsampled samples
+# of windows which are not yet complete are carried to the next block.
+# The result is identical to spectrogramarray() on the complete signal.
+
+def spectrogramstreamstart(signallen, fs, specdownsample, specwindowsecs, specstrides):
+
+	dsfs, windowlen, counterstart = spectrogramwindows(
+		signallen, fs, specdownsample, specwindowsecs, specstrides)
+
+	state = {
+		"fs": dsfs, "windowlen": windowlen, "counterstart": counterstart,
+		"downsample": specdownsample, "nextwindow": 0,
+		"buffer": np.zeros(0), "bufferstart": 0,
+		"magarray": [], "freqarray": [] }
+
+	return state
+
+def spectrogramstreamblock(state, block, blockstart):
+
+	downsample = state["downsample"]
+	windowlen = state["windowlen"]
+	counterstart = state["counterstart"]
+	period = 1/state["fs"]
+
+	# Downsampled positions in this block, continuing the global grid
+	offset = -blockstart % downsample
+	state["buffer"] = np.append(state["buffer"], block[offset::downsample])
+	bufferstart = state["bufferstart"]
+	bufferstop = bufferstart + len(state["buffer"])
+
+	while state["nextwindow"] < len(counterstart):
+		countstart = counterstart[state["nextwindow"]]
+		if countstart + windowlen > bufferstop: break
+		segment = np.abs(state["buffer"][countstart-bufferstart:countstart-bufferstart+windowlen])
+		state["magarray"] += [ abs(np.fft.rfft(segment)) ]
+		state["freqarray"] += [ np.abs(np.fft.rfftfreq(segment.size,period)) ]
+		state["nextwindow"] += 1
+
+	# Keep only the samples still needed by later windows
+	if state["nextwindow"] < len(counterstart):
+		keepfrom = min(counterstart[state["nextwindow"]], bufferstop)
+	else:
+		keepfrom = bufferstop
+	state["buffer"] = state["buffer"][keepfrom-bufferstart:]
+	state["bufferstart"] = keepfrom
+
+	return
+
+def spectrogramstreamend(state, specfreqmin, specfreqmax, spectrumpower):
+
+	return spectrogramrows(
+		state["magarray"], state["freqarray"], state["fs"],
+		specfreqmin, specfreqmax, spectrumpower)
+
 #===============================================================
 
 # Rotation of spectrogram array as heatmap
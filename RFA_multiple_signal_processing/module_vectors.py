@@ -0,0 +1,146 @@
+# module_vectors.py
+# D. Gibbon
+# Created 2022-07-20
+# Property vector input module for numdistnetdendro.py
+
+"""
+Fast input of ragged property vector tables
+
+CSV format: one row per item, name followed by the values, e.g.
+	RT_E1.wav,0.1137,1.4346,0.5840,...
+- The file is read in chunks of lines, and all values of a chunk are
+  parsed in one NumPy call, not one float() per cell, into one
+  preallocated array (a first pass counts the values of each row).
+- The parsed table (names, values, row lengths) is cached in an .npz
+  file next to the CSV file, valid while the CSV file's modification
+  time and size are unchanged.
+- Rows of different lengths are equalised to the longest row in one
+  vectorised operation, with exactly the values of the earlier
+  np.interp(np.linspace(0, size, newsize), np.arange(size), row) loop.
+"""
+
+#===============================================================
+
+import os
+import numpy as np
+
+#===============================================================
+# Bulk CSV parsing with a cache keyed by modification time and size
+
+def csvparse(csvfilename, separator=",", chunkbytes=2**24):
+
+	"""
+Two passes over the file, in chunks of lines: the row lengths (separator
+counts), then the values, parsed chunk by chunk (one NumPy call each)
+into the preallocated value array. Peak memory: the values and a chunk.
+	"""
+
+	names, sizes = [], []
+	with open(csvfilename) as handle:
+		for line in handle:
+			line = line.replace(" ", "").rstrip("\n")
+			if line == "": continue
+			name, _, body = line.partition(separator)
+			names += [ name ]
+			sizes += [ body.count(separator) + 1 if body != "" else 0 ]
+	sizes = np.array(sizes, dtype=np.int64)
+	if np.any(sizes == 0):
+		raise ValueError("%s: rows without values: %s"%(csvfilename,
+			", ".join([ names[k] for k in np.flatnonzero(sizes == 0) ])))
+
+	values = np.empty(int(np.sum(sizes)), dtype=np.float64)
+	position = 0
+	with open(csvfilename) as handle:
+		while True:
+			lines = handle.readlines(chunkbytes)
+			if len(lines) == 0: break
+			bodies = [ line.replace(" ", "").rstrip("\n").partition(separator)[2] for line in lines ]
+			chunk = np.fromstring(separator.join([ body for body in bodies if body != "" ]),
+				dtype=np.float64, sep=separator)
+			if position + len(chunk) > len(values):
+				raise ValueError("%s: malformed values near value %d"%(csvfilename, position))
+			values[position:position+len(chunk)] = chunk
+			position += len(chunk)
+	if position != len(values):
+		raise ValueError("%s: malformed values near value %d"%(csvfilename, position))
+
+	return names, values, sizes
+
+def csvread(csvfilename, separator=",", cache=True):
+
+	"""Returns names, all values as one flat array, and the row lengths."""
+
+	cachefilename = csvfilename + ".npz"
+	stat = os.stat(csvfilename)
+	key = np.array([ stat.st_mtime_ns, stat.st_size ], dtype=np.int64)
+
+	if cache and os.path.exists(cachefilename):
+		with np.load(cachefilename) as cached:
+			if np.array_equal(cached["key"], key):
+				return cached["names"].tolist(), cached["values"], cached["sizes"]
+
+	names, values, sizes = csvparse(csvfilename, separator)
+	if cache:
+		tmpfilename = "%s.tmp%d"%(cachefilename, os.getpid())
+		with open(tmpfilename, "wb") as handle:
+			np.savez(handle, key=key, names=np.array(names, dtype=str), values=values, sizes=sizes)
+		os.replace(tmpfilename, cachefilename)
+
+	return names, values, sizes
+
+def csvrows(values, sizes):
+
+	"""The rows as views of the flat value array."""
+
+	ends = np.cumsum(sizes)
+
+	return [ values[end-size:end] for end, size in zip(ends, sizes) ]
+
+#===============================================================
+# Vectorised length equalisation of ragged rows
+
+def equaliserows(data, newsize=None, names=None):
+
+	"""
+Every row resampled at newsize points (default: longest row), at
+positions linspace(0, size, newsize) of its own index axis, with the
+last value held beyond the end, as np.interp did row by row.
+A row without values is an error (ValueError, with its name if given).
+	"""
+
+	if isinstance(data, np.ndarray) and data.ndim == 2:
+		# Dense matrix (e.g. featurematrix, fixed grids): rows of one length
+		sizes = np.full(len(data), data.shape[1])
+		values = data.astype(np.float64).ravel()
+	else:
+		sizes = np.array([ len(row) for row in data ])
+		values = np.concatenate([ np.asarray(row, dtype=np.float64) for row in data ])
+	if np.any(sizes == 0):
+		empty = np.flatnonzero(sizes == 0)
+		raise ValueError("Rows without values: %s"%", ".join(
+			[ str(names[k]) if names is not None else "row %d"%k for k in empty ]))
+	if newsize is None: newsize = int(np.max(sizes))
+	starts = np.cumsum(sizes) - sizes
+
+	# Positions as np.linspace computes them: j * (size / (newsize-1)), last = size
+	if newsize > 1:
+		positions = np.arange(newsize)[np.newaxis, :] * (sizes / (newsize-1))[:, np.newaxis]
+		positions[:, -1] = sizes
+	else:
+		positions = np.zeros((len(sizes), 1))
+
+	last = (sizes - 1)[:, np.newaxis]
+	lower = np.minimum(np.floor(positions).astype(np.int64), np.maximum(last-1, 0))
+	upper = np.minimum(lower + 1, last)
+	fp0 = values[starts[:, np.newaxis] + lower]
+	fp1 = values[starts[:, np.newaxis] + upper]
+
+	# As np.interp: slope * (x - xp[j]) + fp[j], last value at and beyond the end
+	result = (fp1 - fp0) * (positions - lower) + fp0
+	beyond = positions >= last
+	result[beyond] = values[np.broadcast_to(starts[:, np.newaxis] + last, lower.shape)[beyond]]
+
+	return result
+
+#===============================================================
+# EOF
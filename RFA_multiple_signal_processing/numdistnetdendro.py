@@ -15,135 +15,21 @@
 #==============================================================
 #==============================================================
 
-# CONFIGURATION
-
-def inputtextlines(filename):
-	handle = open(filename,'r')
-	linelist = handle.readlines()
-	handle.close()
-	return linelist
-
-#==============================================================
-# Graphviz network representation
-
-def distnetworks(names, data, distances, netname, distmetric, mindistance, maxdistance):
-
-	filename = netname + "-gv-" + distmetric
-
-	# Select: dot, neato, fdp, twopi und circo
-
-	d = Graph('D', filename=filename, engine='dot', format='png')
-	d.attr('node', shape='ellipse', fontsize='12', size='6,6', rankdir='LR')
-
-	dist_square = dist.squareform(distances)
-
-	dist_list = dist_square.reshape(dist_square.shape[0] * dist_square.shape[1])
-
-	dist_list = (dist_list - np.min(dist_list)) / (np.max(dist_list) - np.min(dist_list))
-
-	ncount = len(dist_list)
-	dist_square = dist_list.reshape(dist_square.shape)
-
-	count = 0
-	for i in range(0, len(names)-1):
-		for j in range(i+1, len(names)):
-			firstname = names[i]
-			secondname = names[j]
-			distance = dist_square[i][j]
-			if distance >= mindistance and distance <= maxdistance:
-				count += 1
-				d.node(firstname)
-				d.node(secondname)
-				d.edge(firstname, secondname, label="%.3f"%distance)
-
-	d.node(netname +"\n" + distmetric + ' distance metric\nn=%d/%d, %s min %s max'%(count,ncount,mindistance, maxdistance), shape='box')
-
-	d.render(filename, view=False, format="png")
-
-	return
-
-#==============================================================
-
-# Create dendrogram
+# Create dendrograms and networks (see module_dendro.py)
 
 def drawdendrogram(names, data, netname, dendroname, figparams, mindistance, maxdistance, showgraph):
 
-	(figwidth, figheight, boxwidth, boxheight,
-		halign, valign, orientation,
-		netname, dendroname) = figparams
-
 	# Length equalisation loop missing in earlier versions. Added on 2022-07-11, DG
 	# Equalise lengths of data
-	newsize = np.max( [ len(val) for val in data ] )
-	valuelist = []
-	for val in data:
-		size = len(val)
-		xloc = np.arange(size)
-		new_xloc = np.linspace(0, size, newsize)
-		new_data = np.interp(new_xloc, xloc, val)
-		valuelist += [ new_data ]
-	data = np.array(valuelist)
-
-	#---------------------------------------------------------
-	# Distance metrics
-	"""
-	# Exhaustive list for testing:
-	distmetriclist = ['braycurtis', 'canberra', 'chebyshev', 'cityblock', 'correlation', 'cosine',
-		'dice', 'euclidean', 'hamming', 'jaccard', 'jensenshannon', 'kulsinski',
-		'mahalanobis', 'matching', 'minkowski', 'rogerstanimoto', 'russellrao', 'seuclidean',
-		'sokalmichener', 'sokalsneath', 'sqeuclidean', 'yule']
-	"""
-
-	# Short list: some of the other distance metrics yield zero or nan
-	distmetriclist = ['canberra', 'chebyshev', 'cityblock', 'correlation', 'cosine', 'euclidean' ]
+	# All rows at once (see module_vectors.py), same values as the per-row np.interp loop
+	data = equaliserows(data, names=names)
 
+	# Distances once per metric; one task per network and per dendrogram
 	print("Loop through similarity types: calculate distance table, create dendrogram")
-	for distmetric in distmetriclist:
-
-		print("----> Similarity type:", distmetric)
-		distances = dist.pdist(data, metric=distmetric)
-
-		#---------------------------------------------------------
-		# GRAPHVIZ: similarity networks
-		distnetworks(names, data, distances, netname, distmetric, mindistance, maxdistance)
-
-		#---------------------------------------------------------
-		methodlist = [ 'single', 'complete', 'average', 'weighted', 'centroid', 'median', 'ward' ]
-		# Cycle through selected clustering methods
-		for method in methodlist:
-
-			print("===> Similarity type:", distmetric, "Clustering method:", method)
-			dendrographname = "%-s-%s-%s"%(dendroname,distmetric,method)
-
-			# Define figure
-			fig = plt.figure(figsize=(figwidth, figheight))
-
-			ax1 = fig.add_axes([halign, valign, boxwidth, boxheight])
-			ax1.set_xlabel(dendrographname, fontsize=12)
-
-			# Set plot font size for x-axis
-#			plt.rc('xtick', labelsize=10)
-			# rcParams.update({'font.size': 10})
-			orientation = 'left'	# Change to 'right' or 'top' if leaf labels are cut off
-
-			# Cluster calculation from distances and method
-			Y1 = hy.linkage(distances, method=method)
-
-			# Dendrogram creation from linkages and labels
-			# cutoff = 0.3*np.max(Y1[:,2])
-			hy.dendrogram(Y1,
-				orientation=orientation,
-				above_threshold_color='black', color_threshold=0,
-				count_sort="False", distance_sort=False,
-				labels=names, leaf_font_size=12)
+	tasks = dendrotasks(names, data, netname, dendroname, figparams, mindistance, maxdistance, jobs)
 
-			# 	plt.tight_layout()	# Seems incompatible with dendrogram figure
-
-			plt.savefig(dendrographname + ".png")
-			if showgraph:
-				plt.show()
-
-			plt.close(fig)	# Close each graph in loop after saving and displaying
+	# Rendering, in parallel with jobs > 1 (configuration or --jobs N)
+	dendrorun(tasks, jobs, showgraph, dendroname + "-index.csv")
 
 	return
 
@@ -158,9 +44,9 @@ try:
 	import numpy as np
 	from matplotlib import rcParams
 	import matplotlib.pyplot as plt
-	import scipy.cluster.hierarchy as hy
-	import scipy.spatial.distance as dist
-	from graphviz import Graph
+	from module_vectors import csvread, csvrows, equaliserows
+	from module_dendro import dendrotasks, dendrotable, dendrorun, distmetriclist
+	from module_distance import distanceread
 	import codecs
 	encoding = "utf8"
 	configfilename = "distance.conf"
@@ -172,37 +58,39 @@ except:
 
 if True:
 
-	if len(sys.argv) < 2:
-		print("Error. Usage: %s <yournumvectorfile.csv>"%sys.argv[0])
+	from numdistnetdendro_conf import *
+
+	# Optional number of parallel rendering processes: --jobs N
+	if "--jobs" in sys.argv:
+		k = sys.argv.index("--jobs")
+		jobs = int(sys.argv[k+1])
+		del sys.argv[k:k+2]
+
+	if len(sys.argv) < 2 or (sys.argv[1].endswith(".npz") and len(sys.argv) < 3):
+		print("Error. Usage: %s [--jobs N] <yournumvectorfile.csv>"%sys.argv[0])
+		print("       %s [--jobs N] <yourfeaturestore.npz> <featurename>"%sys.argv[0])
+		print("       %s [--jobs N] <yourdistancefile.npy>"%sys.argv[0])
 		exit()
 
 	csvfilename = sys.argv[1]
-	filebase = re.sub(".csv", "", re.sub(".*/", "", csvfilename))
+	featurestore = csvfilename.endswith(".npz")	# binary feature store input
+	distancefile = csvfilename.endswith(".npy")	# precomputed distances
+	if featurestore:
+		featurename = sys.argv[2]
+		filebase = featurename
+	elif distancefile:
+		# <table>-<metric>.npy, as in DISTANCES; other names: metric "precomputed"
+		filebase = re.sub(r"\.npy$", "", re.sub(".*/", "", csvfilename))
+		distmetric = re.sub(".*-", "", filebase)
+		if distmetric in distmetriclist:
+			filebase = filebase[:-len(distmetric)-1]
+		else:
+			distmetric = "precomputed"
+	else:
+		filebase = re.sub(".csv", "", re.sub(".*/", "", csvfilename))
 	dendroname = "DENDRO/"+filebase + "-dendro"
 	netname = "GRAPHVIZ/" + filebase + "-network"
 
-	from numdistnetdendro_conf import *
-	"""
-	#---------------------------------------------------------------
-	# Assign configuration parameters to variables (see .conf file)
-	conflines = [
-		re.sub(" ","",line.rstrip()).split("=")
-		for line in inputtextlines(configfilename)
-		if line[0] != '#'
-		]
-	confdict = { line[0] : line[1] for line in conflines if line != [] and line[0] != '' }
-
-	showgraph = False if confdict['showgraph'] == 'False' else True
-	figwidth = float(confdict['figwidth'])
-	figheight = float(confdict['figheight'])
-	boxwidth = float(confdict['boxwidth'])
-	boxheight = float(confdict['boxheight'])
-	halign = float(confdict['halign'])
-	valign = float(confdict['valign'])
-	orientation = confdict['orientation']
-	mindistance = float(confdict['mindistance'])
-	maxdistance = float(confdict['maxdistance'])
-	"""
 	# Dendrogram parameters
 	figparams = (figwidth, figheight, boxwidth, boxheight,
 		halign, valign, orientation, netname, dendroname)
@@ -212,14 +100,28 @@ if False:
 
 # INPUT CSV TABLE AS NAME LIST AND VALUELIST, GENERATE DENDROGRAM
 
-if True:
-	# Preprocess CSV strings
-	csvlist = inputtextlines(csvfilename)
-	csvlist = [re.sub(" ","",line.rstrip()).split(",") for line in csvlist ]
+if featurestore:
+	# Read the feature directly from the store, no text parsing:
+	# rows of one length (fixed grids) as one dense block, else row by row
+	from module_features import featurestoreread, featurematrix
+	try:
+		names, data = featurematrix(csvfilename, featurename)
+	except ValueError:
+		names, data = featurestoreread(csvfilename, [ featurename ])[featurename]
+
+	drawdendrogram(names, data, netname, dendroname, figparams, mindistance, maxdistance, showgraph)
 
-	# Extract name list and vector list from propvectors
-	names = [ row[0] for row in csvlist ]
-	data = [ [ float(chars) for chars in row[1:]] for row in csvlist ]
+elif distancefile:
+	# Precomputed distance matrix: no vectors, no distance computation
+	names, distances = distanceread(csvfilename)
+	tasks = dendrotable(filebase, names, None, { distmetric: distances },
+		netname, dendroname, figparams, mindistance, maxdistance)
+	dendrorun(tasks, jobs, showgraph, dendroname + "-index.csv")
+
+else:
+	# Bulk parsing of the CSV table, cached (see module_vectors.py)
+	names, values, sizes = csvread(csvfilename)
+	data = csvrows(values, sizes)
 
 	drawdendrogram(names, data, netname, dendroname, figparams, mindistance, maxdistance, showgraph)
 
@@ -1,17 +1,64 @@
-# configuration file for distance.py
-
-separator = ","
-
-showgraph = False
-
-figwidth = 6
-figheight = 4
-boxwidth = 0.65
-boxheight = 0.83
-halign = 0.02
-valign = 0.14
-# Change this if necessary (options: left, right, top, bottom)
-orientation = "left"
-
-mindistance = 0.0
-maxdistance = 0.5
+# configuration file for distance.py
+
+separator = ","
+
+showgraph = False
+
+figwidth = 6
+figheight = 4
+boxwidth = 0.65
+boxheight = 0.83
+halign = 0.02
+valign = 0.14
+# Change this if necessary (options: left, right, top, bottom)
+orientation = "left"
+
+mindistance = 0.0
+maxdistance = 0.5
+
+# Parallel rendering of dendrograms and networks (command line: --jobs N)
+jobs = 1
+
+# Distance networks: Graphviz sources (.gv) only, then rendered by concurrent
+# layout processes; unchanged graphs are not rendered again
+gvdeferred = True
+gvengine = "dot"	# layout program; sources of large graphs select sfdp
+gvjobs = 0		# concurrent layout processes (0: one per CPU)
+gvsfdpedges = 2000	# sfdp layout above this number of edges (0: never)
+
+# Large tables: condensed float32 distances, computed in blocks of at most
+# distanceblockbytes in parallel, memory-mapped in distancedirectory.
+# Dendrograms still need a float64 copy in RAM for linkage (n^2/2 x 8
+# bytes: 3.6 GB for 30000 rows); one worker at a time computes it
+distanceblockedrows = 10000	# from this number of rows (0: never)
+distanceblockbytes = 2**26
+distancedirectory = "DISTANCES"
+
+# Distance cache in distancedirectory: large tables always; smaller tables
+# only if distancecache (else exact pdist, no files); only the distances
+# of new rows are computed
+distancecache = False
+
+# Fused kernel (large tables, and cached smaller tables): all metrics of a
+# block of pairs in one pass, correlation, cosine and euclidean from Gram
+# matrix products (False: as pdist)
+distancefused = True
+
+# Large tables, from dendrolargeleaves rows (0: never): truncated dendrograms,
+# "lastp" (last dendrotruncatep merges) or "level" (dendrotruncatep levels),
+# at most dendrolabelmax leaf labels; full linkage matrix in -linkage.npy,
+# members of dendroclusters flat clusters in -clusters.csv
+dendrolargeleaves = 500
+dendrotruncate = "lastp"
+dendrotruncatep = 50
+dendrolabelmax = 60
+dendroclusters = 50
+
+# Distance networks: edges with normalised distance in [mindistance, maxdistance]
+# ("range") or to the networkneighbours nearest neighbours of each node ("knn");
+# at most networkedgemax edges, the shortest (0: all); selection in blocks of
+# at most networkblockbytes
+networkmode = "range"
+networkneighbours = 3
+networkedgemax = 0	# e.g. 5000 for very large tables; 0 keeps all edges, as before
+networkblockbytes = 2**26
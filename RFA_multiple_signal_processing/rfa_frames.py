@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+# rfa_frames.py
+# D. Gibbon
+# Created 2022-07-20
+# Frame-synchronous AM/FM feature tensor export
+
+"""
+Usage: rfa_frames.py [--jobs N] <wavdirectory/ | corpus.pack>
+
+Writes the frame-synchronous features of all files (see module_frames.py)
+to the FRAMES directory:
+	rfa_frames.npy		(frames, features) float32 tensor, memory-mappable
+	rfa_frames_index.npy	name, offset, frames of each file (or channel)
+	rfa_frames.json		frame rate and feature (column) names
+Reading, e.g. for model training, without any signal processing:
+	tensor, index, framerate, columns = frametensorread("FRAMES/rfa_frames.npy")
+	item = tensor[index["offset"][k]:index["offset"][k]+index["frames"][k]]
+"""
+
+import sys, re, os
+
+# Worker thread limits, set before numpy is imported (see module_parallel.py)
+import rfa_mult_conf
+from module_parallel import threadpreset
+threadpreset(int(sys.argv[sys.argv.index("--jobs")+1]) if "--jobs" in sys.argv else rfa_mult_conf.jobs,
+	rfa_mult_conf.workerthreads)
+
+import numpy as np
+from glob import glob
+
+from module_audio import packnames
+from module_analysis import rfaread, rfaworkerinit
+from module_schedule import wavduration, scheduleworkers, scheduleorder, schedulechannels
+from module_pipeline import pipelinerun
+from module_parallel import parallelrun
+from module_F0 import f0poolstart, f0poolstop
+from module_frames import *
+
+from rfa_mult_conf import *
+
+#===============================================================
+# Input: directory of WAV files or packed corpus, optional --jobs N
+
+if "--jobs" in sys.argv:
+	k = sys.argv.index("--jobs")
+	jobs = int(sys.argv[k+1])
+	del sys.argv[k:k+2]
+
+if len(sys.argv) < 2:
+	print("Error. Usage: %s [--jobs N] <wavdirectory/ | corpus.pack>"%sys.argv[0])
+	exit()
+
+wavfiledirectory = sys.argv[1]
+if re.search(r"\.pack/?$", wavfiledirectory):
+	packfilename = wavfiledirectory.rstrip("/")
+	wavfilelist = sorted([ packfilename+"/"+name for name in packnames(packfilename) ])
+else:
+	wavfilelist = sorted(glob(wavfiledirectory+"*.wav"))
+
+#===============================================================
+# Items and frame counts from the headers; tensor allocation
+
+columns, amgrid, fmgrid = framecolumns(tensorbins)
+
+itemnames = []
+itemframes = []
+for wavfilename in wavfilelist:
+	wavfilebase = re.sub(".*/", "", wavfilename)
+	try:
+		seconds, channelcount = wavduration(wavfilename)
+	except Exception:
+		seconds, channelcount = 0, 1	# unreadable: recorded as failed below
+	for c in range(channelcount):
+		itemnames += [ wavfilebase if channelcount == 1 else "%s:ch%d"%(wavfilebase, c+1) ]
+		itemframes += [ framecount(seconds, tensorframerate) ]
+
+os.makedirs(tensordirectory, exist_ok=True)
+tensorfilename = tensordirectory + "/rfa_frames.npy"
+tensor, offsets = frametensoropen(tensorfilename, itemframes, columns)
+itemoffsets = dict(zip(itemnames, offsets))
+itemcounts = dict(zip(itemnames, itemframes))
+
+#===============================================================
+# Extraction: longest first, in a process pool or as a pipeline;
+# each item goes to its own place in the tensor
+
+failed = set()
+
+def storeitems(wavfilename, items, error):
+
+	wavfilebase = re.sub(".*/", "", wavfilename)
+	print(wavfilebase)
+	if error is not None:
+		print("Error:", wavfilebase, "%s: %s"%(type(error).__name__, error))
+		failed.update([ name for name in itemnames
+			if name == wavfilebase or name.startswith(wavfilebase+":ch") ])
+		return
+	for rowname, frames in items:
+		frames = frames[:itemcounts[rowname]]
+		itemcounts[rowname] = len(frames)
+		tensor[itemoffsets[rowname]:itemoffsets[rowname]+len(frames)] = frames
+
+	return
+
+def framesfile(wavfilename):
+
+	return rfaframes(wavfilename, None, tensorframerate, tensorbins)
+
+def framesaudio(wavfilename, audio, readerror):
+
+	try:
+		if readerror is not None: raise readerror
+		items, error = rfaframes(wavfilename, audio, tensorframerate, tensorbins), None
+	except Exception as framerror:
+		items, error = None, framerror
+	storeitems(wavfilename, items, error)
+
+	return None
+
+order, durations = scheduleorder(wavfilelist)
+workers = scheduleworkers(durations, jobs, ramperaudiominute, schedulerambudget)
+
+if workers > 1:
+	parallelrun(order, framesfile,
+		lambda wavfilename, timedresult, error: storeitems(
+			wavfilename, None if error else timedresult[0], error),
+		workers, rfaworkerinit, (workerthreads,))
+else:
+	# Channel pool forked before the pipeline threads start (see module_F0.py)
+	# (only for multichannel files, at most one worker per channel)
+	if channelworkers != 1: f0poolstart(channelworkers, schedulechannels(order))
+	try:
+		pipelinerun(order, rfaread, framesaudio, lambda wavfilename, result: None, prefetchdepth)
+	finally:
+		f0poolstop()
+
+tensor.flush()
+itemframes = [ 0 if name in failed else itemcounts[name] for name in itemnames ]
+frameindexwrite(tensorfilename, itemnames, offsets, itemframes, columns, tensorframerate)
+print("%s: %d items, %d frames, %d features, %d failed"%(
+	tensorfilename, len(itemnames), tensor.shape[0], tensor.shape[1], len(failed)))
+
+# EOF
@@ -0,0 +1,47 @@
+#!/usr/bin/python3
+# rfa_merge.py
+# D. Gibbon
+# Created 2022-07-20
+# Merge rfa_mult.py feature stores without recomputation
+
+"""
+Usage: rfa_merge.py [--duplicates later|qualify] <outstore.npz> <store1.npz> <store2.npz> ... [csv]
+
+Merges the feature stores of several rfa_mult.py runs (e.g. one
+run per corpus subset) into one store. A row name which occurs in
+more than one store with different values (e.g. the same WAV file
+name in two corpus directories) is an error; with --duplicates later
+the row of the later store is kept, with --duplicates qualify all
+rows are kept, named <store>:<name> (see module_features.py).
+With the final argument 'csv' the merged features are also
+exported as CSV files in the CSV directory.
+"""
+
+import sys
+
+from module_features import featurestoremerge, featurecsvexport
+from rfa_mult_conf import separator, featureprecision, featurecompress
+
+args = sys.argv[1:]
+duplicates = "error"
+if "--duplicates" in args:
+	k = args.index("--duplicates")
+	duplicates = args[k+1] if k+1 < len(args) else ""
+	del args[k:k+2]
+csv = len(args) > 0 and args[-1] == "csv"
+if csv: args = args[:-1]
+
+if len(args) < 2:
+	print("Error. Usage: %s [--duplicates later|qualify] <outstore.npz> <store1.npz> <store2.npz> ... [csv]"%sys.argv[0])
+	exit()
+
+outfilename, storefilenames = args[0], args[1:]
+features = featurestoremerge(storefilenames, outfilename, featureprecision, featurecompress, duplicates)
+
+for featurename, (names, vectors) in features.items():
+	print("%s: %d rows"%(featurename, len(names)))
+
+if csv:
+	featurecsvexport(features, "CSV", separator)
+
+# EOF
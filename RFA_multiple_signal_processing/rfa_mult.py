@@ -32,7 +32,8 @@ Sections can be selected for the custom graphics choices in the above article.
 
 Specifications:
 Input:
-	- mono WAV file, duration at >= 10s
+	- mono or multichannel WAV file, duration at >= 10s
+	  (multichannel: one output row per channel)
 Output:
 	CSV file with values:
 	- AM LF spectrum frequencies
@@ -45,9 +46,11 @@ Output:
 	- AM LF spectrogram magnitudes
 	- FM LF spectrogram frequencies
 	- FM LF spectrogram magnitudes
+	- AM LF band spectrum magnitudes, one row per band (optional)
 Methods:
 	- AM envelope: full-wave rectification (i.e. np.abs(signal)
 	- FM envelope: AMDF (Average Magnitude Difference Function)
+	- AM band envelopes: FIR filterbank, rectification (optional)
 	- AM spectrum: FFT
 	- FM spectrum: FFT
 	- AM spectrogram: moving FFT window
@@ -65,13 +68,27 @@ Implementation:
 	Modules:
 		- module_F0.py
 		- module_spectrogram.py
+		- module_features.py
+		- module_analysis.py
+		- module_manifest.py
+		- module_schedule.py
+		- module_pipeline.py
+		- module_parallel.py
+		- module_shard.py
 """
 
 #===============================================================
 #===============================================================
 # System and library module import
 
-import sys, re
+import sys, re, os, time, socket
+
+# Worker thread limits, set before numpy is imported (see module_parallel.py)
+import rfa_mult_conf
+from module_parallel import threadpreset
+threadpreset(int(sys.argv[sys.argv.index("--jobs")+1]) if "--jobs" in sys.argv else rfa_mult_conf.jobs,
+	rfa_mult_conf.workerthreads)
+
 import numpy as np
 import matplotlib.pyplot as plt
 import scipy.io.wavfile as wave
@@ -82,6 +99,16 @@ from glob import glob
 # RFA custom module import
 from module_F0 import *	# FM demodulation (F0 estimation, 'pitch' tracking)
 from module_spectrogram import *	# Low frequency spectrogram functions
+from module_envelope import *	# Multi-rate AM envelope extraction
+from module_peaks import *	# Spectral peak extraction
+from module_audio import *	# Memory-mapped WAV input
+from module_features import *	# Binary feature store and CSV export
+from module_analysis import *	# Analysis of one WAV file
+from module_manifest import *	# Incremental runs: content hashes, cache
+from module_schedule import *	# Batch scheduling: longest first, workers
+from module_pipeline import *	# Prefetching read, analyse, write pipeline
+from module_parallel import *	# Process pool for independent files
+from module_shard import *	# Work units shared by several hosts
 
 #===============================================================
 #===============================================================
@@ -94,183 +121,245 @@ datetoday = datetime.today().strftime('%Y-%m-%d-%H:%M:%S')
 
 from rfa_mult_conf import *
 
-#---------------------------------------------------------------
-# CSV output
-
-def outputtextlines(text, filename):
-	handle = open(filename,'w')
-	linelist = handle.write(text)
-	handle.close()
-	return
-
-def appendtextlines(text, filename):
-	handle = open(filename,'a')
-	linelist = handle.write(text)
-	handle.close()
-	return
-
-def csvoutput(i, wavfilebase, vectors, csvfile):
-	outputstring = wavfilebase + separator + separator.join(
-			[str(mag) for mag in vectors ]) + "\n"
-	if i==0: outputtextlines(outputstring, csvfile)
-	else: appendtextlines(outputstring, csvfile)
-	return
-
 #===============================================================
 #===============================================================
 # Filenames; WAV file error handling and input
 
 appfilename = re.sub("^.*/","",sys.argv[0])
 
+# Optional number of parallel worker processes: --jobs N
+if "--jobs" in sys.argv:
+	k = sys.argv.index("--jobs")
+	jobs = int(sys.argv[k+1])
+	del sys.argv[k:k+2]
+
+# Optional work directory shared by several hosts: --shard DIRECTORY
+if "--shard" in sys.argv:
+	k = sys.argv.index("--shard")
+	sharddirectory = sys.argv[k+1]
+	del sys.argv[k:k+2]
+
 if len(sys.argv) > 1:
 	wavfiledirectory = sys.argv[1]
 else:
 	wavfiledirectory = "DATA/DATA_RT/"	# demo mode default data
 	datasetname = "RFA_N_RT"							# output files prefix
 
-wavfilelist = sorted(glob(wavfiledirectory+"*.wav"))
+# Directory of WAV files, or packed corpus (see rfa_pack.py)
+if re.search(r"\.pack/?$", wavfiledirectory):
+	packfilename = wavfiledirectory.rstrip("/")
+	wavfilelist = sorted([ packfilename+"/"+name for name in packnames(packfilename) ])
+else:
+	wavfilelist = sorted(glob(wavfiledirectory+"*.wav"))
 
 #===============================================================
 #===============================================================
 # Cycle through the filenames in the given directory, building lists
+# Each file is analysed independently (see module_analysis.py):
+#	- unchanged files are taken from the cache (see module_manifest.py)
+#	- a failing file is recorded in the manifest, and the batch continues
+
+wavnamelist = [ re.sub(".*/", "", wavfilename) for wavfilename in wavfilelist ]	# to label nodes in distance map
+
+# Work directory shared by several hosts: one manifest per host
+if sharddirectory is not None:
+	os.makedirs(sharddirectory, exist_ok=True)
+	manifestfile = "%s/manifest-%s.json"%(sharddirectory, socket.gethostname())
+
+config = confighash(analysisconfig())
+manifest = manifestread(manifestfile)
+manifest = { name: manifest[name] for name in wavfilelist if name in manifest }
+os.makedirs(cachedirectory, exist_ok=True)
+manifesttime = time.time()
+
+#---------------------------------------------------------------
+# Analysis of a batch of files (all files, or one work unit)
+# progress() is called for each file, whatever the outcome: analysed,
+# failed, taken from the cache, or skipped after an earlier failure
+
+def rfabatch(batchlist, progress=None):
+
+	#---------------------------------------------------------------
+	# Plan: files in the cache, files which failed before, files to analyse
+
+	cachefiles = {}
+	cachedlist = []
+	analyselist = []
+	failedcount = 0
+
+	for wavfilename in batchlist:
+		entry = manifestentry(manifest, wavfilename)
+		cachefiles[wavfilename] = cachefilename(cachedirectory, wavfilename, entry["hash"], config)
+		if incremental and os.path.exists(cachefiles[wavfilename]):
+			cachedlist += [ wavfilename ]
+		elif entry.get("status") == "failed" and entry.get("config") == config and not retryfailed:
+			print(re.sub(".*/", "", wavfilename), "(failed in an earlier run, skipped)")
+			failedcount += 1
+			if progress is not None: progress()
+		else:
+			analyselist += [ wavfilename ]
+
+	#---------------------------------------------------------------
+	# Schedule (see module_schedule.py): longest first, workers, time
+
+	analyselist, durations = scheduleorder(analyselist)
+	workers = scheduleworkers(durations, jobs, ramperaudiominute, schedulerambudget)
+	rate = schedulerate(manifest, secondsperaudiominute)
+	predictedtime = scheduletime(analyselist, durations, workers, rate)
+
+	print("Files: %d, cached: %d, to analyse: %d (%.1f audio minutes), workers: %d"%(
+		len(batchlist), len(cachedlist), len(analyselist), sum(durations.values())/60, workers))
+	print("Predicted time: %.0f s (%.2f s per audio minute)"%(predictedtime, rate))
+
+	#---------------------------------------------------------------
+	# Files in the cache
+
+	filefeatures = {}	# features of each file, collected in sorted order below
+
+	for wavfilename in cachedlist:
+		filefeatures[wavfilename] = featurestoreread(cachefiles[wavfilename])
+		if progress is not None: progress()
+		manifest[wavfilename].update(status="ok", config=config, cache=cachefiles[wavfilename])
+		manifest[wavfilename].pop("error", None)
+
+	#---------------------------------------------------------------
+	# Analysis, longest file first
+	# With several workers: in a process pool (see module_parallel.py)
+	# With one worker: as a pipeline (see module_pipeline.py), the next
+	# files are read ahead and the cache files are written in separate
+	# threads, while the main thread analyses
+
+	analysedcount = 0
+	runstart = time.time()
+
+	def collectfile(wavfilename, result, seconds, error):
 
-wavnamelist = []		# to label nodes in distance map
+		global manifesttime
+		nonlocal analysedcount, failedcount
 
-f0list = []
+		wavfilebase = re.sub(".*/", "", wavfilename)
+		entry = manifest[wavfilename]
 
-lfamsmlist = []
-lffmsmlist = []
+		if progress is not None: progress()
 
-lfammaxflist = []
-lfammaxmlist = []
-lffmmaxflist = []
-lffmmaxmlist = []
+		if error is not None:
+			entry.update(status="failed", config=config, error="%s: %s"%(type(error).__name__, error))
+			print("Error:", wavfilebase, entry["error"])
+			manifestwrite(manifest, manifestfile)
+			failedcount += 1
+			return None
 
-lfamsmfile = "CSV/lfamspecmags.csv"
-lffmsmfile = "CSV/lffmspecmags.csv"
+		filefeatures[wavfilename] = result
+		analysedcount += 1
 
-lfammaxffile = "CSV/lfammaxfreqs.csv"
-lfammaxmfile = "CSV/lfammaxmags.csv"
+		entry.update(status="ok", config=config, cache=cachefiles[wavfilename],
+			seconds=seconds, minutes=durations[wavfilename]/60)
+		entry.pop("error", None)
 
-lffmmaxffile = "CSV/lffmmaxfreqs.csv"
-lffmmaxmfile = "CSV/lffmmaxmags.csv"
+		# Periodic manifest checkpoint
+		if time.time() - manifesttime > manifestinterval:
+			manifestwrite(manifest, manifestfile)
+			manifesttime = time.time()
+
+		return result
+
+	def analysefile(wavfilename, audio, readerror):
+
+		print(re.sub(".*/", "", wavfilename))
+
+		analysisstart = time.time()
+		try:
+			if readerror is not None: raise readerror
+			result, error = rfaanalysis(wavfilename, audio), None
+		except Exception as analysiserror:
+			result, error = None, analysiserror
+
+		return collectfile(wavfilename, result, time.time()-analysisstart, error)
+
+	def writefile(wavfilename, result):
+
+		if incremental and result is not None:
+			featurestorewrite(cachefiles[wavfilename], result, "float64", False)
+
+		return
+
+	def collectparallel(wavfilename, timedresult, error):
+
+		print(re.sub(".*/", "", wavfilename))
+		result, seconds = timedresult if error is None else (None, 0)
+		writefile(wavfilename, collectfile(wavfilename, result, seconds, error))
+
+		return
+
+	if workers > 1:
+		# Process pool (see module_parallel.py), results in order of completion
+		parallelrun(analyselist, rfaanalysis, collectparallel, workers,
+			rfaworkerinit, (workerthreads,))
+	else:
+		# Channel pool forked before the pipeline threads start (see module_F0.py)
+		# (only for multichannel files, at most one worker per channel)
+		if channelworkers != 1: f0poolstart(channelworkers, schedulechannels(analyselist))
+		try:
+			pipelinerun(analyselist, rfaread, analysefile, writefile, prefetchdepth)
+		finally:
+			f0poolstop()
+
+	manifestwrite(manifest, manifestfile)
+	print("Files analysed: %d, cached: %d, failed: %d, time: %.0f s"%(
+		analysedcount, len(cachedlist), failedcount, time.time()-runstart))
+
+	#---------------------------------------------------------------
+	# Feature rows in sorted file order, independent of the schedule
+
+	features = featurecollection(featurenames)
+	for wavfilename in batchlist:
+		if wavfilename in filefeatures:
+			featureextend(features, filefeatures[wavfilename])
+
+	return features
+
+#===============================================================
+#===============================================================
+# Single host, or one of several hosts sharing a work directory
+# (see module_shard.py); each host takes units until all are done,
+# also those of crashed hosts, then one host merges and writes
+
+if sharddirectory is None:
+	features = rfabatch(wavfilelist)
+
+else:
+	units = shardunits(sharddirectory, wavfilelist, shardunitsize)
+	if units is None:
+		print("Work directory %s was set up for another file list: use a new directory, or remove it."%sharddirectory)
+		exit()
+
+	while shardopen(sharddirectory, len(units)) > 0:
+		claimedcount = 0
+		for unit, unitlist in enumerate(units):
+			claimfilename = shardclaim(sharddirectory, unit, shardexpiry)
+			if claimfilename is None: continue
+			print("Work unit %d of %d"%(unit+1, len(units)))
+			unitfeatures = rfabatch(unitlist, lambda: shardtouch(claimfilename))
+			featurestorewrite(shardfilename(sharddirectory, unit, "npz"), unitfeatures, "float64", False)
+			sharddone(sharddirectory, unit, claimfilename)
+			claimedcount += 1
+		if claimedcount == 0 and shardopen(sharddirectory, len(units)) > 0:
+			print("Units held by other hosts: %d of %d, waiting"%(shardopen(sharddirectory, len(units)), len(units)))
+			time.sleep(shardpoll)
+
+	if shardmergeclaim(sharddirectory, shardexpiry) is None:
+		print("All units done; the output is written, or being written, by another host.")
+		exit()
+	features = shardmerge(sharddirectory, len(units))
+
+#===============================================================
+#===============================================================
+# Output: binary feature store, optional CSV export (one write per file)
 
-lfamtrajmfile = "CSV/lfamtrajmags.csv"
-lfamtrajffile = "CSV/lfamtrajfreqs.csv"
-lffmtrajmfile = "CSV/lffmtrajmags.csv"
-lffmtrajffile = "CSV/lffmtrajfreqs.csv"
+featurestorewrite(featurestore, features, featureprecision, featurecompress)
 
-for i, wavfilename in enumerate(wavfilelist):	# Collect spectra for all files
-	wavfilebase = re.sub(".*/", "", wavfilename)
-	wavefilebase = re.sub(".wav", "", wavfilebase)
-	wavnamelist += [ wavfilebase ]
-	print(wavfilebase)
-
-	#=======================================================
-	# Mono WAV file input and signal time domain properties
-
-	fs, signal = wave.read(wavfilename)	# read sampling frequency and signal
-	signallength = len(signal)		# define numerical signal length
-	signalseconds = signallength / fs	# define signal length in seconds
-	signal = signal / max(abs(signal))	# scale signal: -1 ... 0 ... 1
-
-	#=======================================================
-	# Butterworth LP filter (5 Hz: typical upper limit for LF spectrum)
-
-	b, a = butter(5, 5 / (0.5 * fs), btype="low")	# define Butterworth filter
-
-	#===============================================================
-	#===============================================================
-	# AM demodulation (envelope extraction) by full-wave rectification
-
-	envelope = lfilter(b, a, abs(signal))	# apply filter to create lf envelope
-	envelope = envelope-min(envelope) / (max(envelope)-min(envelope))	# scale
-
-	#===============================================================
-	# AM low frequency spectral analysis
-
-	# FFT of complete envelope, output magnitude values
-	amspecmags = np.abs(np.fft.rfft(envelope))
-	amspecmaglen = len(amspecmags)
-
-	# Extraction of low frequency spectrum segment
-	lfamspecmaglen = int(round(amspecfreqmax * amspecmaglen / (fs / 2)))
-	lfamspecmags = amspecmags[1:lfamspecmaglen]	# DC cutoff
-	lfamspmMin = min(lfamspecmags)
-	# Scale to 0...1
-	lfamspecmags = (lfamspecmags-lfamspmMin) / (np.max(lfamspecmags)-lfamspmMin)
-
-	# Assign LF spectrum frequencies to magnitude values
-	lfamspecfreqs = np.linspace(0,fs/2,amspecmaglen)
-	lfamspecfreqs = lfamspecfreqs[1:lfamspecmaglen]
-
-	# Identification of highest magnitude spectral frequencies
-	amtopmagscount = magscount
-	amtopmags = sorted(lfamspecmags)[-amtopmagscount:]
-	amtoppos = [ list(lfamspecmags).index(m) for m in amtopmags ]
-	amtopfreqs = [ lfamspecfreqs[p] for p in amtoppos ]
-
-	#===============================================================
-	# Create AM spectrogram and max magnitude value trajectory
-
-	ammagarray, amfreqarray, amtrajmags, amtrajfreqs = spectrogramarray(
-		signal, fs,amspecfreqmin, amspecfreqmax,
-		specdownsample, spectrumpower, specwindowsecs, specstrides
-		)
-
-	#===============================================================
-	#===============================================================
-	# FM demodulation (F0 estimation, pitch extraction)
-	# by AMDF (Absolute Magnitude Difference Function)
-
-	f0array, framerate, frameduration = f0estimate(signal, fs)
-	f0arraylength = len(f0array)
-
-	#===============================================================
-	# FFT low frequency spectral analysis of F0 estimation track
-
-	fmspecmags = np.abs(np.fft.rfft(f0array))
-	fmspecmaglen = len(fmspecmags)
-	fmspecfreqs = np.linspace(0,framerate/2,fmspecmaglen)
-
-	# Extraction of low frequency spectral segment, with magnitude filter
-	lffmspecmaglen = int(round(fmspecfreqmax * fmspecmaglen / (framerate / 2)))
-	lffmspecmags = fmspecmags[1:lffmspecmaglen]
-	lffmspecmags = lffmspecmags / np.max(lffmspecmags)
-
-	# Magnitude filter for LF formant analysis
-	lffmformantmags = [ 0 if m <= fmformantlimit else m for m in lffmspecmags ]
-	lffmspecfreqs = fmspecfreqs[1:lffmspecmaglen]	# DC cutoff
-
-	# Identification of highest magnitude spectral frequencies
-	fmtopmagscount = magscount
-	fmtopmags = sorted(lffmspecmags)[-fmtopmagscount:]
-	fmtoppos = [ list(lffmspecmags).index(m) for m in fmtopmags ]
-	fmtopfreqs = [ lffmspecfreqs[p] for p in fmtoppos ]
-
-	#===============================================================
-	# Create FM spectrogram and max value trajectory
-
-	fmmagarray, fmfreqarray, fmtrajmags, fmtrajfreqs = spectrogramarray(
-		f0array, framerate, fmspecfreqmin, fmspecfreqmax,
-		specdownsample, spectrumpower, specwindowsecs, specstrides
-		)
-
-	#===============================================================
-	# AM spectrum CSV outputs
-	csvoutput(i, wavfilebase, lfamspecmags, lfamsmfile)
-	csvoutput(i, wavfilebase, amtopmags, lfammaxmfile)
-	csvoutput(i, wavfilebase, amtopfreqs, lfammaxffile)
-	# AM spectrogram max trajectory CSV outputs
-	csvoutput(i, wavfilebase, amtrajmags, lfamtrajmfile)
-	csvoutput(i, wavfilebase, amtrajfreqs, lfamtrajffile)
-	# FM spectrum CSV outputs
-	csvoutput(i, wavfilebase, lffmspecmags, lffmsmfile)
-	csvoutput(i, wavfilebase, fmtopmags, lffmmaxmfile)
-	csvoutput(i, wavfilebase, fmtopfreqs, lffmmaxffile)
-	# AM spectrogram max trajectory CSV outputs
-	csvoutput(i, wavfilebase, fmtrajmags, lffmtrajmfile)
-	csvoutput(i, wavfilebase, fmtrajfreqs, lffmtrajffile)
+if csvexport:
+	featurecsvexport(features, "CSV", separator)
 
 #===============================================================
 # EOF
@@ -24,6 +24,40 @@ End license text.
 # CSV separator
 separator = ","
 
+# Feature store (see module_features.py) and CSV export
+featurestore = "FEATURES/rfa_mult_features.npz"
+featureprecision = "float32"	# "float16", "float32" or "float64"
+featurecompress = True	# compressed .npz archive
+csvexport = True	# also write the CSV files in the CSV directory
+
+# Incremental runs (see module_manifest.py)
+incremental = True	# reuse cached results of unchanged files
+manifestfile = "FEATURES/rfa_mult_manifest.json"
+cachedirectory = "FEATURES/CACHE"
+retryfailed = False	# analyse files which failed in an earlier run again
+manifestinterval = 30	# seconds between manifest checkpoints
+
+# Batch scheduling (see module_schedule.py)
+jobs = 1	# maximum number of worker processes (command line: --jobs N)
+workerthreads = 1	# BLAS/FFT threads per worker process (with jobs > 1, also the main process)
+ramperaudiominute = 200	# MB of RAM needed per minute of audio (all channels)
+schedulerambudget = 0	# MB of RAM for all workers (0: available RAM)
+secondsperaudiominute = 2.0	# processing rate until measured in a run
+
+# Sharded processing by several hosts (see module_shard.py)
+sharddirectory = None	# shared work directory (command line: --shard DIRECTORY)
+shardunitsize = 100	# files per work unit
+shardexpiry = 3600	# seconds after which a claim without progress is stale
+shardpoll = 60	# seconds between checks while other hosts hold the open units
+
+# Frame-synchronous feature tensor (rfa_frames.py, see module_frames.py)
+tensordirectory = "FRAMES"
+tensorframerate = 100	# common frame rate (frames per second)
+tensorbins = 16	# AM and FM spectrogram rows: points on the frequency grid
+
+# Prefetching pipeline (see module_pipeline.py)
+prefetchdepth = 2	# files read ahead and outputs queued (0: no pipeline)
+
 # Figure show and size
 showgraph = True
 figwidth = 10
@@ -57,6 +91,31 @@ specheatmaptype = "YlOrRd"
 specgramdotsize = 60
 fontsize = 10
 
+# Multi-rate AM envelope extraction (see module_envelope.py)
+# If False (default), the 5 Hz Butterworth filter runs at the full sampling
+# rate, as in earlier versions. If True, much faster, but the results differ
+# slightly: the LF spectrum may have one bin more (e.g. 224 instead of 223),
+# and the magnitudes differ by up to about 0.02
+multirateenvelope = False
+envelopefsmin = 50	# lowest envelope sampling rate after decimation (Hz)
+envelopecutoff = 5	# envelope low pass filter cutoff (Hz)
+envelopeorder = 5	# envelope low pass filter order
+
+# Multichannel WAV files: F0 workers for concurrent channels (0: one per channel; at most one per CPU)
+channelworkers = 0
+
+# Multi-band AM analysis (band-wise rhythm formants, see module_envelope.py)
+ambandanalysis = False
+ambands = [ (50, 300), (300, 1000), (1000, 3000), (3000, 8000) ]	# Hz
+ambandtaps = 255	# FIR filterbank length, must be odd
+
+# Fixed grids: LF spectra sampled at gridfreqpoints frequencies up to
+# amspecfreqmax / fmspecfreqmax, trajectories at gridtimepoints equally
+# spaced times; every feature is then a dense (files, points) matrix
+fixedgrid = False
+gridfreqpoints = 64
+gridtimepoints = 100
+
 # Minimum and maximum spectrum and spectrogram frequencies
 amspecfreqmin = 0
 amspecfreqmax = 5
@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+# rfa_pack.py
+# D. Gibbon
+# Created 2022-07-20
+# Pack a directory of WAV files into one corpus file
+
+"""
+Usage: rfa_pack.py <wavdirectory/> <corpus.pack>
+
+Packs all WAV files of a directory into one contiguous blob of raw
+sample data, <corpus>.pack, with an index, <corpus>.pack.npy:
+	name		WAV file name (without directory)
+	offset		byte offset of the samples in the blob
+	length		length in samples (per channel)
+	fs		sampling rate
+	channels	channel count
+	dtype		sample type, e.g. <i2
+Samples are stored as in the WAV file, interleaved if multichannel,
+and each item starts at a 16 byte boundary.
+
+The corpus is read with module_audio.py, which memory-maps the blob:
+	rfa_mult.py <corpus.pack>		all items, in name order
+	rfa_single.py <corpus.pack>/<name>	one item
+"""
+
+import sys, re
+import numpy as np
+from glob import glob
+
+from module_audio import wavread
+
+#===============================================================
+
+packalign = 16
+
+def packwrite(wavfilelist, packfilename):
+
+	names = []
+	offsets = []
+	lengths = []
+	rates = []
+	channelcounts = []
+	dtypes = []
+
+	offset = 0
+	with open(packfilename, "wb") as blob:
+		for wavfilename in wavfilelist:
+			fs, signal = wavread(wavfilename)
+			data = np.ascontiguousarray(signal).tobytes()
+			padding = -len(data) % packalign
+			blob.write(data + b"\0" * padding)
+
+			names += [ re.sub(".*/", "", wavfilename) ]
+			offsets += [ offset ]
+			lengths += [ signal.shape[0] ]
+			rates += [ fs ]
+			channelcounts += [ 1 if signal.ndim == 1 else signal.shape[1] ]
+			dtypes += [ signal.dtype.str ]
+			offset += len(data) + padding
+
+	index = np.zeros(len(names), dtype=[
+		("name", "U%d"%max([ len(name) for name in names ] + [1])),
+		("offset", np.int64), ("length", np.int64), ("fs", np.int32),
+		("channels", np.int16), ("dtype", "U8") ])
+	index["name"] = names
+	index["offset"] = offsets
+	index["length"] = lengths
+	index["fs"] = rates
+	index["channels"] = channelcounts
+	index["dtype"] = dtypes
+	np.save(packfilename + ".npy", index)
+
+	return index
+
+#===============================================================
+
+if len(sys.argv) < 3:
+	print("Error. Usage: %s <wavdirectory/> <corpus.pack>"%sys.argv[0])
+	exit()
+
+wavfiledirectory, packfilename = sys.argv[1], sys.argv[2]
+wavfilelist = sorted(glob(wavfiledirectory+"*.wav"))
+
+index = packwrite(wavfilelist, packfilename)
+print("%s: %d files, %d samples"%(packfilename, len(index), np.sum(index["length"])))
+
+# EOF
@@ -0,0 +1,91 @@
+# module_peaks.py
+# D. Gibbon
+# Created 2022-07-20
+# Spectral peak extraction module for rfa.py
+
+"""
+Highest magnitude spectral peaks
+
+Method:
+	- true local maxima: higher than the left neighbour,
+	  at least as high as the right neighbour
+	- selection of the highest peaks with argpartition, not a full sort
+	- parabolic interpolation of peak frequency and magnitude
+	  from the neighbouring bins
+	- if a spectrum has fewer local maxima than requested,
+	  the highest remaining bins fill the list (not interpolated)
+Input may be one spectrum (1-D) or a batch of spectra (2-D, one per row),
+e.g. all the rows of a spectrogram, which are then processed in one call.
+Peaks are returned in ascending order of magnitude, as with sorted().
+"""
+
+#===============================================================
+
+import numpy as np
+
+#===============================================================
+
+def spectralpeaks(mags, freqs, count):
+
+	"""
+Returns peak magnitudes, peak frequencies and peak bin positions,
+each with count values per spectrum (shape (count,) for a 1-D input,
+(spectra, count) for a 2-D input).
+freqs is either one frequency axis for all spectra or one per spectrum.
+	"""
+
+	mags = np.asarray(mags, dtype=float)
+	single = mags.ndim == 1
+	mags = np.atleast_2d(mags)
+	freqs = np.broadcast_to(np.asarray(freqs, dtype=float), mags.shape)
+	rows, binlen = mags.shape
+	count = min(count, binlen)
+
+	#============================================
+	# Local maxima (the edge bins cannot be true peaks)
+
+	ispeak = np.zeros(mags.shape, dtype=bool)
+	ispeak[:, 1:-1] = (mags[:, 1:-1] > mags[:, :-2]) & (mags[:, 1:-1] >= mags[:, 2:])
+
+	# Ranking key: every peak ranks above every non-peak
+	span = np.max(mags, axis=1, keepdims=True) - np.min(mags, axis=1, keepdims=True)
+	key = np.where(ispeak, mags, mags - span - 1)
+
+	#============================================
+	# Top count positions, then ascending order of magnitude
+
+	if count < binlen:
+		positions = np.argpartition(key, binlen-count, axis=1)[:, binlen-count:]
+	else:
+		positions = np.tile(np.arange(binlen), (rows, 1))
+	order = np.argsort(np.take_along_axis(key, positions, axis=1), axis=1, kind="stable")
+	positions = np.take_along_axis(positions, order, axis=1)
+
+	#============================================
+	# Parabolic interpolation through the peak and its neighbours
+
+	peakmags = np.take_along_axis(mags, positions, axis=1)
+	peakfreqs = np.take_along_axis(freqs, positions, axis=1)
+	interpolate = np.take_along_axis(ispeak, positions, axis=1)
+
+	left = np.clip(positions-1, 0, binlen-1)
+	right = np.clip(positions+1, 0, binlen-1)
+	a = np.take_along_axis(mags, left, axis=1)
+	c = np.take_along_axis(mags, right, axis=1)
+	denominator = a - 2*peakmags + c
+	interpolate = interpolate & (denominator != 0)
+	delta = np.zeros(positions.shape)
+	delta[interpolate] = 0.5 * (a-c)[interpolate] / denominator[interpolate]
+
+	binwidth = 0.5 * (np.take_along_axis(freqs, right, axis=1)
+		- np.take_along_axis(freqs, left, axis=1))
+	peakfreqs = peakfreqs + delta * binwidth
+	peakmags = peakmags - 0.25 * (a-c) * delta
+
+	if single:
+		return peakmags[0], peakfreqs[0], positions[0]
+
+	return peakmags, peakfreqs, positions
+
+#===============================================================
+# EOF
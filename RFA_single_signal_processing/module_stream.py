@@ -0,0 +1,96 @@
+# module_stream.py
+# D. Gibbon
+# Created 2022-07-20
+# Out-of-core analysis module for rfa_single.py
+
+"""
+Out-of-core analysis of very long recordings
+
+The memory-mapped WAV file is read block by block, and each block
+goes through all signal-rate stages before the next block is read:
+	- AM envelope: rectification, staged decimation, low pass filter
+	- F0 preprocessing (clipping, Butterworth filters) and AMDF frames
+	- AM spectrogram window extraction
+	- waveform display: minimum and maximum per envelope sample
+Filter states, and the samples which later frames and windows still
+need, are carried from block to block, so the results are identical
+to in-memory processing.
+Only the low rate results are kept, so peak RAM is set by the block
+length, which is derived from a RAM budget in MB.
+"""
+
+#===============================================================
+
+import numpy as np
+
+from module_audio import wavread, signalpeak
+from module_envelope import amenvelopestreamstart, amenvelopestreamblock, amenvelopestreamend
+from module_F0 import f0streamstart, f0streamblock, f0streamend
+from module_spectrogram import spectrogramstreamstart, spectrogramstreamblock, spectrogramstreamend
+
+#===============================================================
+# Block length from RAM budget
+
+# Approximate bytes held per block sample: the float64 block and the
+# temporary arrays of the envelope, F0 and spectrogram stages
+streambytespersample = 96
+
+def streamblocksize(rambudget, factor):
+
+	blocksize = int(rambudget * 2**20 / streambytespersample)
+	blocksize = max(factor, blocksize // factor * factor)	# whole decimation steps
+
+	return blocksize
+
+#===============================================================
+# Streamed analysis of one WAV file
+
+def streamanalysis(wavfilename, starttime, stoptime, channel, rambudget,
+	envfsmin, cutoff, order,
+	amspecfreqmin, amspecfreqmax, specdownsample, spectrumpower, specwindowsecs, specstrides):
+
+	"""
+Returns, as for in-memory processing:
+	fs, signal length (samples), AM envelope and its sampling rate,
+	AM spectrogram (magnitudes, frequencies, trajectory magnitudes and
+	frequencies), F0 track, F0 frame rate, F0 frame duration,
+and the waveform display (minima and maxima at the envelope rate).
+	"""
+
+	fs, signal = wavread(wavfilename, starttime, stoptime, channel)	# memory-mapped
+	signallength = len(signal)
+	peak = signalpeak(signal)	# one pass, no copy
+
+	envstate = amenvelopestreamstart(fs, envfsmin, cutoff, order)
+	f0state = f0streamstart(signallength, fs)
+	specstate = spectrogramstreamstart(
+		signallength, fs, specdownsample, specwindowsecs, specstrides)
+
+	factor = envstate["factor"]
+	blocksize = streamblocksize(rambudget, factor)
+
+	displaymin = []
+	displaymax = []
+	for blockstart in range(0, signallength, blocksize):
+		block = np.divide(signal[blockstart:blockstart+blocksize], peak, dtype=np.float64)
+
+		amenvelopestreamblock(envstate, block)
+		f0streamblock(f0state, block)
+		spectrogramstreamblock(specstate, block, blockstart)
+
+		padded = np.pad(block, (0, -len(block) % factor), mode="edge")
+		displaymin += [ np.min(padded.reshape(-1, factor), axis=1) ]
+		displaymax += [ np.max(padded.reshape(-1, factor), axis=1) ]
+
+	envelope, envfs = amenvelopestreamend(envstate)
+	f0array, framerate, frameduration = f0streamend(f0state)
+	ammagarray, amfreqarray, ammaxmags, ammaxfreqs = spectrogramstreamend(
+		specstate, amspecfreqmin, amspecfreqmax, spectrumpower)
+	display = (np.concatenate(displaymin), np.concatenate(displaymax))
+
+	return (fs, signallength, envelope, envfs,
+		ammagarray, amfreqarray, ammaxmags, ammaxfreqs,
+		f0array, framerate, frameduration, display)
+
+#===============================================================
+# EOF
@@ -32,11 +32,11 @@ Sections can be selected for the custom graphics choices in the above article.
 
 Specifications:
 Input:
-	- mono WAV file, duration at >= 10s
+	- mono WAV file, duration at >= 10s (multichannel: one selected channel)
 Output:
 	PNG graph with panels:
 	- AM envelope
-	- AM LF spectrum
+	- AM LF spectrum (optional: with AM LF band spectra)
 	- FM envelope (F0 estimation, pitch track)
 	- FM LF spectrum
 	- AM LF spectrogram
@@ -48,6 +48,7 @@ Output:
 Methods:
 	- AM envelope: full-wave rectification (i.e. np.abs(signal)
 	- FM envelope: AMDF (Average Magnitude Difference Function)
+	- AM band envelopes: FIR filterbank, rectification (optional)
 	- AM spectrum: FFT
 	- FM spectrum: FFT
 	- AM spectrogram: moving FFT window
@@ -84,6 +85,10 @@ from datetime import datetime
 from module_F0 import *	# FM demodulation (F0 estimation, 'pitch' tracking)
 from module_spectrogram import *	# Low frequency spectrogram functions
 from module_dendrogram import *	# Spectral dendrogram drawing functions
+from module_envelope import *	# Multi-rate AM envelope extraction
+from module_peaks import *	# Spectral peak extraction
+from module_audio import *	# Memory-mapped WAV input
+from module_stream import *	# Out-of-core analysis of long recordings
 
 #===============================================================
 #===============================================================
@@ -100,34 +105,56 @@ appfilename = re.sub("^.*/","",sys.argv[0])
 if len(sys.argv) > 1:
 	wavfilename = sys.argv[1]	# get input filename from command line
 else:
-	print("Usage: %s <yourwavfile.wav>"%appfilename)
+	print("Usage: %s <yourwavfile.wav> [starttime stoptime]"%appfilename)
 	exit()
 
+# Optional time range in seconds: only this region is read and analysed
+starttime = float(sys.argv[2]) if len(sys.argv) > 2 else None
+stoptime = float(sys.argv[3]) if len(sys.argv) > 3 else None
+
 wavfilebase = re.sub("^.*/","",wavfilename)
+if starttime is not None or stoptime is not None:
+	wavfilebase = "%s_%s-%ss"%(wavfilebase, sys.argv[2], sys.argv[3] if stoptime is not None else "")
 figurefilename = "FIGURES/RFA_%s.png"%wavfilebase
 csvfilename = "CSV/RFA%s.csv"%wavfilebase
 
 #===============================================================
 #===============================================================
-# Mono WAV file input and signal time domain properties
-
-fs, signal = wave.read(wavfilename)							
+# WAV file input (one channel) and signal time domain properties
 
-# read sampling frequency and signal
-signallength = len(signal)		# define numerical signal length
-signalseconds = signallength / fs	# define signal length in seconds
-signal = signal / max(abs(signal))	# normalise signal scale: -1 ... 0 ... 1
+if outofcore:
+	# Block by block: AM envelope, AM spectrogram and F0 in one pass
+	(fs, signallength, envelope, envfs,
+		ammagarray, amfreqarray, ammaxmags, ammaxfreqs,
+		f0array, framerate, frameduration, waveformdisplay) = streamanalysis(
+		wavfilename, starttime, stoptime, channel, outofcoreram,
+		envelopefsmin, envelopecutoff, envelopeorder,
+		amspecfreqmin, amspecfreqmax,
+		specdownsample, spectrumpower, specwindowsecs, specstrides)
+	signalseconds = signallength / fs	# define signal length in seconds
 
-#===============================================================
-# Butterworth low pass filter (5 Hz is a typical upper limit for the LF spectrum)
-
-b, a = butter(5, 5 / (0.5 * fs), btype="low")	# define Butterworth filter
+else:
+	# memory-map sampling frequency and signal, select time range and channel
+	fs, signal = wavread(wavfilename, starttime, stoptime, channel)
+	signallength = len(signal)		# define numerical signal length
+	signalseconds = signallength / fs	# define signal length in seconds
+	signal = normalise(signal)	# normalise signal scale: -1 ... 0 ... 1
 
 #===============================================================
 #===============================================================
 # AM demodulation (envelope extraction) by full-wave rectification
+# Butterworth low pass filter (5 Hz is a typical upper limit for the LF spectrum)
 
-envelope = lfilter(b, a, abs(signal))		# apply filter to create lf envelope
+if outofcore:
+	pass	# the envelope has already been extracted block by block
+elif multirateenvelope:
+	# Rectify, decimate in stages, filter at the low envelope rate
+	envelope, envfs = amenvelope(
+		signal, fs, envelopefsmin, envelopecutoff, envelopeorder)
+else:
+	b, a = butter(5, 5 / (0.5 * fs), btype="low")	# define Butterworth filter
+	envelope = lfilter(b, a, abs(signal))		# apply filter to create lf envelope
+	envfs = fs
 envelope = envelope-min(envelope) / (max(envelope)-min(envelope))	# scale 0 ... 1
 
 #===============================================================
@@ -138,39 +165,51 @@ amspecmags = np.abs(np.fft.rfft(envelope))
 amspecmaglen = len(amspecmags)
 
 # Extraction of low frequency spectrum segment
-lfamspecmaglen = int(round(amspecfreqmax * amspecmaglen / (fs / 2)))
+lfamspecmaglen = int(round(amspecfreqmax * amspecmaglen / (envfs / 2)))
 lfamspecmags = amspecmags[1:lfamspecmaglen]	# DC cutoff
 lfamspmMin = min(lfamspecmags)
 # Scale to 0...1
 lfamspecmags = (lfamspecmags-lfamspmMin) / (np.max(lfamspecmags)-lfamspmMin)
 
 # Assign LF spectrum frequencies to magnitude values
-lfamspecfreqs = np.linspace(0,fs/2,amspecmaglen)
+lfamspecfreqs = np.linspace(0,envfs/2,amspecmaglen)
 lfamspecfreqs = lfamspecfreqs[1:lfamspecmaglen]
 
 # Identification of highest magnitude spectral frequencies
 amtopmagscount = magscount
-amtopmags = sorted(lfamspecmags)[-amtopmagscount:]
-amtoppos = [ list(lfamspecmags).index(m) for m in amtopmags ]
-amtopfreqs = [ lfamspecfreqs[p] for p in amtoppos ]
+amtopmags, amtopfreqs, amtoppos = spectralpeaks(
+	lfamspecmags, lfamspecfreqs, amtopmagscount)
 
 # Redefinition for column chart display
 amrhythmbars = lfamspecfreqs
 amweightlist = lfamspecmags
 
+#===============================================================
+# Optional band-wise AM LF spectra (bands x frequencies), one
+# envelope per FIR filterbank band (see module_envelope.py)
+
+if ambandanalysis and outofcore:
+	print("Note: AM band analysis needs the complete signal; not available with outofcore.")
+elif ambandanalysis:
+	lfambandmags, lfambandfreqs = ambandspectra(
+		signal, fs, ambands, ambandtaps,
+		envelopefsmin, envelopecutoff, envelopeorder, amspecfreqmax)
+
 #===============================================================
 # Create AM spectrogram and max magnitude value trajectory
 
-ammagarray, amfreqarray, ammaxmags, ammaxfreqs = spectrogramarray(
-	signal, fs,amspecfreqmin, amspecfreqmax,
-	specdownsample, spectrumpower, specwindowsecs, specstrides)
+if not outofcore:
+	ammagarray, amfreqarray, ammaxmags, ammaxfreqs = spectrogramarray(
+		signal, fs,amspecfreqmin, amspecfreqmax,
+		specdownsample, spectrumpower, specwindowsecs, specstrides)
 
 #===============================================================
 #===============================================================
 # FM demodulation (F0 estimation, pitch extraction)
 # by AMDF (Absolute Magnitude Difference Function)
 
-f0array, framerate, frameduration = f0estimate(signal, fs)
+if not outofcore:
+	f0array, framerate, frameduration = f0estimate(signal, fs)
 f0arraylength = len(f0array)
 
 #===============================================================
@@ -191,9 +230,8 @@ lffmspecfreqs = fmspecfreqs[1:lffmspecmaglen]	# DC cutoff
 
 # Identification of highest magnitude spectral frequencies
 fmtopmagscount = magscount
-fmtopmags = sorted(lffmspecmags)[-fmtopmagscount:]
-fmtoppos = [ list(lffmspecmags).index(m) for m in fmtopmags ]
-fmtopfreqs = [ lffmspecfreqs[p] for p in fmtoppos ]
+fmtopmags, fmtopfreqs, fmtoppos = spectralpeaks(
+	lffmspecmags, lffmspecfreqs, fmtopmagscount)
 
 # Redefinition for column bar display
 fmrhythmbars = lffmspecfreqs
@@ -219,8 +257,15 @@ plt.suptitle("%s, fs=%d [RFA M]"%(wavfilename, fs), fontweight="bold")
 #===============================================================
 # Plot waveform and envelope
 
-xaxistime = np.linspace(0, signalseconds, signallength)
-plt01.plot(xaxistime, signal, color="lightgrey")
+if outofcore:
+	# Waveform minima and maxima at the envelope rate, not every sample
+	displaymin, displaymax = waveformdisplay
+	xaxistime = np.linspace(0, signalseconds, len(displaymin))
+	plt01.fill_between(xaxistime, displaymin, displaymax, color="lightgrey")
+else:
+	xaxistime = np.linspace(0, signalseconds, signallength)
+	plt01.plot(xaxistime, signal, color="lightgrey")
+xaxistime = np.linspace(0, signalseconds, len(envelope))
 plt01.plot(xaxistime, envelope, color="red", label="AM envelope")
 plt01.set_xlim(0,np.ceil(signalseconds))
 plt01.set_xlabel("Time (s)")
@@ -236,6 +281,9 @@ plt02.hist(amrhythmbars, weights=amweightlist, bins=bincount, color="lightgreen"
 
 plt02.axhline(y=amformantlimit, linestyle=":", label="AM LF formant min "+str(amformantlimit))
 plt02.plot(lfamspecfreqs, lfamspecmags, color="green", label="AM LF spectrum")
+if ambandanalysis and not outofcore:
+	for (low, high), bandmags in zip(nyqvistbands(fs, ambands), lfambandmags):
+		plt02.plot(lfambandfreqs, bandmags, linewidth=0.5, label="AM band %d-%d Hz"%(low, high))
 plt02.scatter(amtopfreqs, amtopmags, s=24, color="red")
 for f,m in zip(amtopfreqs, amtopmags):
 	plt02.text(f, m-0.1, " %.3fHz"%f, fontsize=6)
@@ -286,7 +334,7 @@ plt05.set_title("5. AM rhythm spectrogram (heatmap)", fontsize=fontsize)
 
 # Envelope overlay as an alignment aid
 if envelopeoverlay:
-	x = np.linspace(0, signalseconds, len(signal))
+	x = np.linspace(0, signalseconds, len(envelope))
 	env = envelope
 	env = amspecfreqmax * env - np.min(env)
 	plt05.plot(x, env, color="grey", linewidth=0.5, label="AM envelope")
@@ -344,7 +392,7 @@ plt07.set_title("7. FM LF spectrogram (heatmap)", fontsize=fontsize)
 
 # Envelope overlay as an alignment aid
 if envelopeoverlay:
-	x = np.linspace(0, signalseconds, len(signal))
+	x = np.linspace(0, signalseconds, len(envelope))
 	env = envelope
 	env = amspecfreqmax * env - np.min(env)
 	plt07.plot(x, env, color="grey", linewidth=0.5, label="AM envelope")
@@ -409,7 +457,7 @@ plt09.grid()
 
 # Envelope overlay as an alignment aid
 if envelopeoverlay:
-	x = np.linspace(0, signalseconds, len(signal))
+	x = np.linspace(0, signalseconds, len(envelope))
 	env = envelope
 	env = amspecfreqmax * env - np.min(env)
 	plt09.plot(x, env, color="grey", linewidth=0.5, label="AM envelope")
@@ -446,7 +494,7 @@ plt11.grid()
 
 # Envelope overlay as an alignment aid
 if envelopeoverlay:
-	x = np.linspace(0, signalseconds, len(signal))
+	x = np.linspace(0, signalseconds, len(envelope))
 	env = envelope
 	env = amspecfreqmax * env - np.min(env)
 	plt11.plot(x, env, color="grey", linewidth=0.5, label="AM envelope")
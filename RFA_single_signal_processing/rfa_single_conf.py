@@ -57,6 +57,29 @@ specheatmaptype = "YlOrRd"
 specgramdotsize = 60
 fontsize = 10
 
+# Multi-rate AM envelope extraction (see module_envelope.py)
+# If False (default), the 5 Hz Butterworth filter runs at the full sampling
+# rate, as in earlier versions. If True, much faster, but the results differ
+# slightly: the LF spectrum may have one bin more (e.g. 224 instead of 223),
+# and the magnitudes differ by up to about 0.02
+multirateenvelope = False
+envelopefsmin = 50	# lowest envelope sampling rate after decimation (Hz)
+envelopecutoff = 5	# envelope low pass filter cutoff (Hz)
+envelopeorder = 5	# envelope low pass filter order
+
+# Out-of-core processing of very long recordings (see module_stream.py)
+# The file is streamed in blocks; the multi-rate envelope is always used
+outofcore = False
+outofcoreram = 1024	# RAM budget for the streamed blocks (MB)
+
+# Multichannel WAV files: channel to be analysed (0: first channel)
+channel = 0
+
+# Multi-band AM analysis (band-wise rhythm formants, see module_envelope.py)
+ambandanalysis = False
+ambands = [ (50, 300), (300, 1000), (1000, 3000), (3000, 8000) ]	# Hz
+ambandtaps = 255	# FIR filterbank length, must be odd
+
 # Minimum and maximum spectrum and spectrogram frequencies
 amspecfreqmin = 0
 amspecfreqmax = 5